@@ -5,6 +5,9 @@ from getm import reader
 
 default_chunk_size = 128 * 1024 * 1024
 default_chunk_size_keep_alive = 1 * 1024 * 1024
+# Range request size for 'concurrency > 1'. Smaller parts keep less data in flight per request, reducing shared memory
+# use and latency. Increase for high latency links.
+default_chunk_size_concurrent = 8 * 1024 * 1024
 default_concurrency = 4
 
 def urlopen(url: str, concurrency: Optional[int]=None) -> reader.BaseURLReader:
@@ -13,7 +16,7 @@ def urlopen(url: str, concurrency: Optional[int]=None) -> reader.BaseURLReader:
     elif 1 == concurrency:
         return reader.URLReaderKeepAlive(url, default_chunk_size_keep_alive)
     else:
-        return reader.URLReader(url, default_chunk_size, concurrency or default_concurrency)
+        return reader.URLReader(url, default_chunk_size_concurrent, concurrency or default_concurrency)
 
 def iter_content(url: str, concurrency: Optional[int]=None) -> Generator[memoryview, None, None]:
     if concurrency is None:
@@ -21,4 +24,4 @@ def iter_content(url: str, concurrency: Optional[int]=None) -> Generator[memoryv
     elif 1 == concurrency:
         return reader.URLReaderKeepAlive.iter_content(url, default_chunk_size_keep_alive)
     else:
-        return reader.URLReader.iter_content(url, default_chunk_size, concurrency or default_concurrency)
+        return reader.URLReader.iter_content(url, default_chunk_size_concurrent, concurrency or default_concurrency)
@@ -1,19 +1,26 @@
 """Provide a consistent interface to checksumming, smoothing out the various heterodoxies of cloud native checksums.
 I'm looking at you GS and S3.
 """
+import os
 import enum
 import base64
 import hashlib
-import binascii
-from math import ceil
-from typing import List, Optional, Set, Union
-
-import google_crc32c
+import warnings
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Tuple, Optional, Set, Union
 
 
 MB = 1024 * 1024
+CRC32C_COPY_SIZE = MB
+CRC32C_PARALLEL_SIZE = 32 * MB
+CRC32C_SLICE_SIZE = 8 * MB
+CRC32C_POLY = 0x82F63B78  # reflected Castagnoli polynomial
 BytesLike = Union[bytes, bytearray, memoryview]
 
+class ChecksumMismatch(Exception):
+    pass
+
 class _Hasher:
     def __init__(self, data: Optional[bytes]=None):
         pass
@@ -34,22 +41,67 @@ class MD5(_Hasher):
     def matches(self, val: str) -> bool:
         return self._checksum.hexdigest() == val
 
+class _HardwareCRC32C:
+    """crc32c computed with the optional, hardware accelerated, 'crc32c' package. Any buffer is accepted."""
+    def __init__(self, crc32c, data: bytes):
+        self._crc32c = crc32c.crc32c
+        self._crc = self._crc32c(data)
+
+    def update(self, data: BytesLike):
+        executor = _crc32c_executor() if CRC32C_PARALLEL_SIZE <= len(data) else None
+        if executor is None:
+            self._crc = self._crc32c(data, self._crc)
+        else:
+            # Checksum slices on multiple threads ('crc32c' releases the GIL), then merge them in order
+            data = memoryview(data)
+            slices = [data[i: i + CRC32C_SLICE_SIZE] for i in range(0, len(data), CRC32C_SLICE_SIZE)]
+            for slc, crc in zip(slices, executor.map(self._crc32c, slices)):
+                self._crc = crc32c_combine(self._crc, crc, len(slc))
+
+    def digest(self) -> bytes:
+        return self._crc.to_bytes(4, "big")
+
+class _GoogleCRC32C:
+    """crc32c computed with 'google_crc32c'."""
+    def __init__(self, google_crc32c, data: bytes):
+        self._checksum = google_crc32c.Checksum(data)
+
+    def update(self, data: BytesLike):
+        if isinstance(data, bytes):
+            self._checksum.update(data)
+        else:
+            # The google_crc32c C extension only accepts 'bytes'. Copy in small pieces that remain cache resident
+            # instead of materializing the entire part.
+            data = memoryview(data)
+            for i in range(0, len(data), CRC32C_COPY_SIZE):
+                self._checksum.update(bytes(data[i: i + CRC32C_COPY_SIZE]))
+
+    def digest(self) -> bytes:
+        return self._checksum.digest()
+
 class GSCRC32C(_Hasher):
     def __init__(self, data: Optional[bytes]=None):
-        self._checksum = google_crc32c.Checksum(data or b"")
+        # The crc32c implementation is selected once, here, rather than for each update
+        crc32c = _hardware_crc32c()
+        self._checksum: Union[_HardwareCRC32C, _GoogleCRC32C]
+        if crc32c is not None:
+            self._checksum = _HardwareCRC32C(crc32c, data or b"")
+        else:
+            self._checksum = _GoogleCRC32C(_google_crc32c(), data or b"")
 
     def update(self, data: BytesLike):
-        if isinstance(data, memoryview):
-            data = bytes(data)
         self._checksum.update(data)
 
+    def digest(self) -> bytes:
+        return self._checksum.digest()
+
     def hexdigest(self) -> str:
-        return self._checksum.digest().hex()
+        return self.digest().hex()
 
     def gs_crc32c(self) -> str:
         # Compute the crc32c value assigned to Google Storage objects.
         # kind of wonky, right?
-        return base64.b64encode(self._checksum.digest()).decode("utf-8")
+        return base64.b64encode(self.digest()).decode("utf-8")
 
     def matches(self, expected_gs_crc32c: str) -> bool:
         return self.gs_crc32c() == expected_gs_crc32c
@@ -57,46 +109,73 @@ class GSCRC32C(_Hasher):
 class S3Etag(_Hasher):
     def __init__(self, part_size: int):
         self.part_size = part_size
-        self._etags: List[str] = list()
+        self._etags = bytearray()  # concatenated binary part digests
         self._current_md5 = hashlib.md5()
         self._current_part_size = 0
 
     def update(self, data: BytesLike):
-        while len(data) + self._current_part_size >= self.part_size:
-            to_add = self.part_size - self._current_part_size
-            self._current_md5.update(data[:to_add])
-            self._etags.append(self._current_md5.hexdigest())
-            data = data[to_add:]
-            self._current_part_size = 0
-            self._current_md5 = hashlib.md5()
-        self._current_md5.update(data)
-        self._current_part_size += len(data)
+        if len(data) + self._current_part_size < self.part_size:
+            # Fast path for the common case where no part boundary is crossed
+            self._current_md5.update(data)
+            self._current_part_size += len(data)
+            return
+        data = memoryview(data)  # slices of memoryview objects do not copy
+        while data:
+            remaining = self.part_size - self._current_part_size
+            size = min(remaining, len(data))
+            self._current_md5.update(data[:size])
+            self._current_part_size += size
+            if size == remaining:
+                self._etags += self._current_md5.digest()
+                self._current_md5 = hashlib.md5()
+                self._current_part_size = 0
+            data = data[size:]
 
     def s3_etag(self) -> str:
-        if self._current_part_size:
-            self._etags.append(self._current_md5.hexdigest())
-        if 1 == len(self._etags):
-            return self._etags[0]
-        else:
-            bin_md5 = b"".join([binascii.unhexlify(etag) for etag in self._etags])
-            composite_etag = hashlib.md5(bin_md5).hexdigest() + "-" + str(len(self._etags))
-            return composite_etag
+        return _s3_etag(self._etags, self._current_md5, self._current_part_size)
 
     def matches(self, val: str) -> bool:
         return self.s3_etag() == val
 
 class S3MultiEtag(_Hasher):
+    """Compute S3 ETags for all possible part layouts. Layout state is stored as parallel lists so each segment of
+    input between part boundaries is sliced once and shared by every layout.
+    """
     def __init__(self, size: int, number_of_parts: int):
         part_sizes = _s3_multipart_layouts(size, number_of_parts)
         assert 5 >= len(part_sizes), "Too many possible S3 part layouts!"
-        self.etags = [S3Etag(part_size) for part_size in part_sizes]
+        self._part_sizes = list(part_sizes)
+        self._remaining = list(part_sizes)  # bytes remaining in the current part of each layout
+        self._md5s = [hashlib.md5() for _ in part_sizes]
+        self._etags = [bytearray() for _ in part_sizes]  # concatenated binary part digests
+        # hashlib releases the GIL while hashing large buffers, allowing layouts to be computed in parallel
+        self._executor = _s3_etag_executor() if 1 < len(part_sizes) else None
 
     def update(self, data: BytesLike):
-        for etag in self.etags:
-            etag.update(data)
+        if not self._part_sizes:
+            return  # no layout fits the size and part count, so no etag can match
+        data = memoryview(data)
+        while data:
+            # All layouts consume the same segment up to the nearest part boundary
+            segment_size = min(len(data), *self._remaining)
+            segment, data = data[:segment_size], data[segment_size:]
+            if self._executor is None:
+                for md5 in self._md5s:
+                    md5.update(segment)
+            else:
+                for f in [self._executor.submit(md5.update, segment) for md5 in self._md5s]:
+                    f.result()
+            for i, remaining in enumerate(self._remaining):
+                if segment_size == remaining:
+                    self._etags[i] += self._md5s[i].digest()
+                    self._md5s[i] = hashlib.md5()
+                    self._remaining[i] = self._part_sizes[i]
+                else:
+                    self._remaining[i] = remaining - segment_size
 
     def s3_etags(self) -> Set[str]:
-        return {etag.s3_etag() for etag in self.etags}
+        return {_s3_etag(etags, md5, part_size - remaining)
+                for etags, md5, part_size, remaining in zip(self._etags, self._md5s, self._part_sizes, self._remaining)}
 
     def matches(self, val: str) -> bool:
         return val in self.s3_etags()
@@ -108,19 +187,101 @@ class NoopChecksum(_Hasher):
     def matches(self, val: str) -> bool:
         return True
 
+@lru_cache(maxsize=128)
 def _s3_multipart_layouts(size: int, number_of_parts: int) -> List[int]:
-    """Compute all possible part sizes for 'number_of_parts'. Part size is assumbed to be multiples of 1 MB."""
+    """Compute all possible part sizes for 'number_of_parts'. Part size is assumbed to be multiples of 1 MB.
+    The returned list is cached and should not be modified.
+    """
     if 1 == number_of_parts:
         return [size]
     assert size >= MB, "Total size less than 1 MB!"
-    min_part_size = ceil(size / number_of_parts / MB) * MB
-    max_part_size = (ceil(size / (number_of_parts - 1) / MB) - 1) * MB
+    # Integer ceiling division avoids floating point rounding for large sizes
+    min_part_size = -(-size // (number_of_parts * MB)) * MB
+    max_part_size = (-(-size // ((number_of_parts - 1) * MB)) - 1) * MB
     if min_part_size == max_part_size:
         part_sizes = [min_part_size]
     else:
         part_sizes = [min_part_size + i * MB for i in range(1 + (max_part_size - min_part_size) // MB)]
     return part_sizes
 
+def _s3_etag(etags: bytearray, current_md5, current_part_size: int) -> str:
+    # 'etags' contains concatenated binary part digests, which are hashed directly to compute composite etags
+    last_digest = current_md5.digest() if current_part_size else b""
+    number_of_parts = (len(etags) + len(last_digest)) // current_md5.digest_size
+    if 1 == number_of_parts:
+        return (bytes(etags) + last_digest).hex()
+    else:
+        composite_md5 = hashlib.md5(etags)
+        composite_md5.update(last_digest)
+        return composite_md5.hexdigest() + "-" + str(number_of_parts)
+
+# crc32c libraries are imported on first use, avoiding their import cost when only S3 or MD5 checksums are needed
+
+@lru_cache(maxsize=1)
+def _hardware_crc32c():
+    """Return the optional 'crc32c' module if it is installed and hardware accelerated (SSE 4.2/ARMv8), otherwise
+    None. 'crc32c' accepts any buffer, avoiding copies.
+    """
+    try:
+        import crc32c  # type: ignore
+    except ImportError:
+        return None
+    return crc32c if crc32c.hardware_based else None
+
+@lru_cache(maxsize=1)
+def _crc32c_executor() -> Optional[ThreadPoolExecutor]:
+    cpu_count = os.cpu_count() or 1
+    return ThreadPoolExecutor(max_workers=min(cpu_count, 8)) if 1 < cpu_count else None
+
+@lru_cache(maxsize=1)
+def _s3_etag_executor() -> Optional[ThreadPoolExecutor]:
+    # Shared by all S3MultiEtag instances, rather than starting threads for each object
+    cpu_count = os.cpu_count() or 1
+    return ThreadPoolExecutor(max_workers=min(cpu_count, 5)) if 1 < cpu_count else None
+
+def crc32c_combine(crc1: int, crc2: int, len2: int) -> int:
+    """Return the crc32c of the concatenation of two buffers, given the crc32c of each and the length of the second.
+    This follows zlib's 'crc32_combine': the first crc is advanced over 'len2' zero bytes using GF(2) matrix
+    operators, then combined with the second.
+    """
+    power = 0
+    while len2:
+        if len2 & 1:
+            crc1 = _gf2_times(_crc32c_zeros_operator(power), crc1)
+        len2 >>= 1
+        power += 1
+    return crc1 ^ crc2
+
+@lru_cache(maxsize=64)
+def _crc32c_zeros_operator(power: int) -> Tuple[int, ...]:
+    # GF(2) matrix advancing a crc32c register over 2**power zero bytes
+    if 0 == power:
+        op = (CRC32C_POLY,) + tuple(1 << n for n in range(31))  # a single zero bit
+        for _ in range(3):
+            op = tuple(_gf2_times(op, row) for row in op)
+        return op
+    else:
+        op = _crc32c_zeros_operator(power - 1)
+        return tuple(_gf2_times(op, row) for row in op)
+
+def _gf2_times(mat: Tuple[int, ...], vec: int) -> int:
+    res = 0
+    for row in mat:
+        if not vec:
+            break
+        if vec & 1:
+            res ^= row
+        vec >>= 1
+    return res
+
+@lru_cache(maxsize=1)
+def _google_crc32c():
+    import google_crc32c
+    if "c" != google_crc32c.implementation:
+        warnings.warn("google_crc32c is using its pure Python implementation. GS checksums will be very slow. "
+                      "Install 'crc32c' or a binary distribution of 'google-crc32c'.", RuntimeWarning)
+    return google_crc32c
+
 def part_count_from_s3_etag(s3_etag: str) -> int:
     parts = s3_etag.split("-", 1)
     if 1 == len(parts):
@@ -150,7 +311,12 @@ class GETMChecksum:
     def cs(self):
         if not hasattr(self, "_cs"):
             if Algorithms.s3_etag == self.algorithm:
-                self._cs = self.algorithm.cls(self._s3_size, self._s3_part_count)
+                part_sizes = _s3_multipart_layouts(self._s3_size, self._s3_part_count)
+                if 1 == len(part_sizes):
+                    # Only one layout is possible, avoid the overhead of S3MultiEtag
+                    self._cs = S3Etag(part_sizes[0])
+                else:
+                    self._cs = self.algorithm.cls(self._s3_size, self._s3_part_count)
             else:
                 self._cs = self.algorithm.cls()
         return self._cs
@@ -1,6 +1,7 @@
 """Download data from http(s) URLs to the local file system, verifying integrity."""
 import os
 import sys
+import mmap
 import json
 import pprint
 import logging
@@ -8,17 +9,23 @@ import warnings
 import argparse
 import multiprocessing
 from math import ceil
-from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from concurrent.futures import Executor, ThreadPoolExecutor
 from typing import List, Optional
 
 from jsonschema import validate
+from jsonschema.exceptions import ValidationError
+try:
+    import fastjsonschema
+except ImportError:
+    fastjsonschema = None
 
-from getm import default_chunk_size, default_chunk_size_keep_alive
+from getm import default_chunk_size, default_chunk_size_keep_alive, default_chunk_size_concurrent
 from getm.http import http
 from getm.utils import indirect_open, resolve_target
 from getm.progress import ProgressBar, ProgressLogger
-from getm.reader import URLRawReader, URLReaderKeepAlive
-from getm.checksum import Algorithms, GETMChecksum, part_count_from_s3_etag
+from getm.reader import URLRawReader, URLReader, URLReaderKeepAlive
+from getm.checksum import Algorithms, ChecksumMismatch, GETMChecksum, part_count_from_s3_etag
 from getm.concurrent.collections import ConcurrentHeap
 
 
@@ -28,6 +35,7 @@ logger = logging.getLogger(__name__)
 class CLI:
     exit_code = 0
     continue_after_error = False
+    direct_io = False
     cpu_count = multiprocessing.cpu_count()
 
     @classmethod
@@ -36,15 +44,18 @@ class CLI:
 
     @classmethod
     def log_debug(cls, **kwargs):
-        logger.debug(json.dumps(kwargs))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(json.dumps(kwargs))
 
     @classmethod
     def log_info(cls, **kwargs):
-        logger.info(json.dumps(kwargs))
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps(kwargs))
 
     @classmethod
     def log_warning(cls, **kwargs):
-        logger.warning(json.dumps(kwargs))
+        if logger.isEnabledFor(logging.WARNING):
+            logger.warning(json.dumps(kwargs))
 
     @classmethod
     def log_error(cls, **kwargs):
@@ -56,15 +67,16 @@ class CLI:
         cls.exit_code = 1
         logger.exception(json.dumps(kwargs))
 
-def checksum_for_url(url: str) -> Optional[GETMChecksum]:
-    """Probe headers for checksum information, return or None."""
+def checksum_for_url(url: str, size: Optional[int]=None) -> Optional[GETMChecksum]:
+    """Probe headers for checksum information, return or None. Provide 'size' if already known."""
     cs: Optional[GETMChecksum]
     checksums = http.checksums(url)
     if 'gs_crc32c' in checksums:
         cs = GETMChecksum(checksums['gs_crc32c'], "gs_crc32c")
     elif 's3_etag' in checksums:
         cs = GETMChecksum(checksums['s3_etag'], "s3_etag")
-        cs.set_s3_size_and_part_count(http.size(url), part_count_from_s3_etag(checksums['s3_etag']))
+        size = http.size(url) if size is None else size
+        cs.set_s3_size_and_part_count(size, part_count_from_s3_etag(checksums['s3_etag']))
     elif 'md5' in checksums:
         cs = GETMChecksum(checksums['md5'], "md5")
     else:
@@ -76,8 +88,7 @@ class Progress:
     progress_class: type = ProgressBar
 
     @classmethod
-    def get(cls, name: str, url: str):
-        sz = http.size(url)
+    def get(cls, name: str, sz: int):
         if cls.progress_class == ProgressBar:
             incriments = 40
         else:
@@ -90,23 +101,33 @@ def _multipart_buffer_size(concurrency: int) -> int:
     return res
 
 def _download(url: str,
-              filepath: Optional[str],
+              filepath: str,
               cs: Optional[GETMChecksum],
               concurrency: int,
-              multipart_threshold: int):
-    filepath = resolve_target(url, filepath)
+              multipart_threshold: int,
+              size: Optional[int]=None,
+              part_concurrency: int=1,
+              part_executor: Optional[Executor]=None):
+    # 'filepath' is resolved by the caller
+    size = http.size(url) if size is None else size
     try:
-        if multipart_threshold >= http.size(url):
-            oneshot(url, filepath, cs)
+        if multipart_threshold >= size:
+            oneshot(url, filepath, cs, size)
         else:
-            multipart(url, filepath, _multipart_buffer_size(concurrency), cs)
+            multipart(url, filepath, _multipart_buffer_size(concurrency), cs, size, part_concurrency, part_executor)
     except Exception:
         CLI.log_exception(message="Download failed!", url=url)
         raise
 
 def download(manifest: List[dict], concurrency: int=CLI.cpu_count, multipart_threshold=default_chunk_size):
     assert 1 <= concurrency
-    with ProcessPoolExecutor(max_workers=concurrency) as executor:
+    # Downloads are I/O bound. Threads avoid forking a process per download and share the HTTP connection pool.
+    # Concurrency not needed for parallel downloads is given to each download as concurrent range requests. Parts are
+    # fetched by one long-lived thread pool shared by all downloads, rather than starting workers for each download.
+    # Workers are only started if used.
+    part_concurrency = max(1, concurrency // max(1, len(manifest)))
+    with ThreadPoolExecutor(max_workers=concurrency) as executor, \
+            ThreadPoolExecutor(max_workers=concurrency) as part_executor:
         cheap = ConcurrentHeap(executor, concurrency)
         for info in manifest:
             url = info['url']
@@ -117,12 +138,31 @@ def download(manifest: List[dict], concurrency: int=CLI.cpu_count, multipart_thr
                 if not CLI.continue_after_error:
                     CLI.exit()
             else:
-                if 'checksum' in info:
-                    cs: Optional[GETMChecksum] = GETMChecksum(info['checksum'], info['checksum-algorithm'])
-                else:
-                    cs = None
-                priority = -http.size(url)  # give small files larger priority
-                cheap.priority_put(priority, _download, url, info.get('filepath'), cs, concurrency, multipart_threshold)
+                # Derive everything needed from the headers fetched by 'accessable' now, while they are cached. By the
+                # time a download runs they may have been evicted, costing another request.
+                size = http.size(url)
+                try:
+                    if 'checksum' in info:
+                        cs: Optional[GETMChecksum] = GETMChecksum(info['checksum'], info['checksum-algorithm'])
+                    else:
+                        cs = checksum_for_url(url, size)
+                    filepath = resolve_target(url, info.get('filepath'))
+                except Exception:
+                    CLI.log_exception(message="Download failed!", url=url)
+                    if not CLI.continue_after_error:
+                        CLI.exit()
+                    continue
+                priority = -size  # give small files larger priority
+                cheap.priority_put(priority,
+                                   _download,
+                                   url,
+                                   filepath,
+                                   cs,
+                                   concurrency,
+                                   multipart_threshold,
+                                   size,
+                                   part_concurrency,
+                                   part_executor)
         try:
             for f in cheap.iter_futures():
                 try:
@@ -131,46 +171,89 @@ def download(manifest: List[dict], concurrency: int=CLI.cpu_count, multipart_thr
                     if not CLI.continue_after_error:
                         CLI.exit()
         finally:
-            # Attempt to halt subprocesses if parent dies prematurely
+            # Attempt to halt pending downloads if the main thread exits prematurely
             cheap.abort()
 
-def oneshot(url: str, filepath: str, cs: Optional[GETMChecksum]=None):
-    cs = cs or checksum_for_url(url)
+def oneshot(url: str, filepath: str, cs: Optional[GETMChecksum]=None, size: Optional[int]=None):
+    size = http.size(url) if size is None else size
+    cs = cs or checksum_for_url(url, size)
     log_info = dict(message="initiating oneshot download", url=url, expected_checksum=None)
     if cs:
         log_info['expected_checksum'] = cs.expected
         log_info['checksum_algorithm'] = cs.algorithm.name
     CLI.log_info(**log_info)
-    with URLRawReader(url) as handle:
-        data = handle.read()
-        try:
-            if cs:
-                cs.update(data)
-                assert cs.matches(), "Checksum failed!"
-            with open(filepath, "wb", buffering=0) as fh:
-                fh.write(data)
-            with Progress.get(filepath, url) as progress:
-                progress.add(len(data))
-        finally:
-            data.release()
+    with Progress.get(filepath, size) as progress:
+        with URLRawReader(url, size) as reader, indirect_open(filepath, size=size) as handle:
+            if size:
+                # Read the response into the memory mapped file in pieces of 'read_size'. urllib3 copies each read
+                # through a temporary bytes object, so bounding reads bounds that allocation. Each piece is checksummed
+                # and reported to progress while it is cache resident.
+                os.ftruncate(handle.fileno(), size)
+                with mmap.mmap(handle.fileno(), size) as mm:
+                    view = memoryview(mm)
+                    try:
+                        bytes_read, read_size = 0, default_chunk_size_keep_alive
+                        while bytes_read < size:
+                            length = reader.handle.readinto(view[bytes_read: bytes_read + read_size])
+                            if not length:
+                                raise ValueError(f"Incomplete download: received {bytes_read} of {size} bytes")
+                            if cs:
+                                cs.update(view[bytes_read: bytes_read + length])
+                            bytes_read += length
+                            progress.add(length)
+                    finally:
+                        view.release()
+                handle.seek(size)
+            if reader.handle.read(1):
+                raise ValueError(f"Download exceeds expected size of {size} bytes")
+            if cs and not cs.matches():
+                raise ChecksumMismatch("Checksum failed!")
     CLI.log_debug(message="completed oneshot download", url=url)
 
-def multipart(url: str, filepath: str, buffer_size: int, cs: Optional[GETMChecksum]=None):
-    cs = cs or checksum_for_url(url)
+def multipart(url: str,
+              filepath: str,
+              buffer_size: int,
+              cs: Optional[GETMChecksum]=None,
+              size: Optional[int]=None,
+              part_concurrency: int=1,
+              part_executor: Optional[Executor]=None):
+    """Download 'url' in parts. If 'part_concurrency' is larger than one, that many range requests are kept in flight
+    using the pool 'part_executor', if provided. Otherwise parts are streamed over a single connection into a
+    circular buffer of size 'buffer_size'.
+    """
+    size = http.size(url) if size is None else size
+    cs = cs or checksum_for_url(url, size)
     log_info = dict(message="initiating multipart download", url=url, expected_checksum=None)
     if cs:
         log_info['expected_checksum'] = cs.expected
         log_info['checksum_algorithm'] = cs.algorithm.name
     CLI.log_info(**log_info)
-    with Progress.get(filepath, url) as progress:
-        with indirect_open(filepath) as handle:
-            for part in URLReaderKeepAlive.iter_content(url, default_chunk_size_keep_alive, buffer_size):
-                handle.write(part)
-                if cs:
-                    cs.update(part)
-                progress.add(len(part))
-            if cs:
-                assert cs.matches(), "Checksum failed!"
+    with Progress.get(filepath, size) as progress:
+        with indirect_open(filepath, size=size, direct=CLI.direct_io) as handle, \
+                ThreadPoolExecutor(max_workers=1) as writer:
+            # Bind per-part calls to local names, bypassing attribute lookups and the GETMChecksum indirection
+            submit, write, add_progress = writer.submit, handle.write, progress.add
+            update_checksum = cs.cs.update if cs else None
+            if 1 < part_concurrency:
+                parts = URLReader.iter_content(url,
+                                               default_chunk_size_concurrent,
+                                               part_concurrency,
+                                               size,
+                                               part_executor)
+            else:
+                parts = URLReaderKeepAlive.iter_content(url, default_chunk_size_keep_alive, buffer_size, size)
+            for part in parts:
+                # Write the part on a separate thread while it is checksummed, then wait before it is released.
+                # Only one write may be in flight: released parts are immediately reused by the circular buffer.
+                write_future = submit(write, part)
+                try:
+                    if update_checksum is not None:
+                        update_checksum(part)
+                finally:
+                    write_future.result()
+                add_progress(len(part))
+            if cs and not cs.matches():
+                raise ChecksumMismatch("Checksum failed!")
     CLI.log_debug(message="completed multipart download", url=url)
 
 # TODO: validate URL format
@@ -194,7 +277,18 @@ manifest_schema = {
 
 def _validate_manifest(manifest: List[dict]):
     CLI.log_debug(message="validating manifest", manifest=manifest, schema=manifest_schema)
-    validate(instance=manifest, schema=manifest_schema)
+    if fastjsonschema is not None:
+        # The optional 'fastjsonschema' compiles the schema to Python code, validating large manifests much faster
+        try:
+            _compiled_manifest_validator()(manifest)
+        except fastjsonschema.JsonSchemaException as e:
+            raise ValidationError(e.message)
+    else:
+        validate(instance=manifest, schema=manifest_schema)
+
+@lru_cache(maxsize=1)
+def _compiled_manifest_validator():
+    return fastjsonschema.compile(manifest_schema)
 
 manifest_arg_help = f"""Download URls as specified in a local json FILE
 FILE must conform to the following schema
@@ -250,6 +344,9 @@ def parse_args(cli_args: Optional[List[str]]=None) -> argparse.Namespace:
                         action="store_true",
                         help=("Continue downloading files if an error occurs."
                               "Exit status is non-zero if any downloads fail."))
+    parser.add_argument("--direct-io",
+                        action="store_true",
+                        help="Bypass the page cache when writing multipart downloads (O_DIRECT/F_NOCACHE).")
     args = parser.parse_args(args=cli_args)
     if not (args.url or args.manifest) or (args.url and args.manifest):
         parser.print_usage()
@@ -267,10 +364,10 @@ def config_cli(args: argparse.Namespace):
     elif args.v:
         logger.setLevel(logging.INFO)
     CLI.continue_after_error = args.continue_after_error
+    CLI.direct_io = args.direct_io
 
 def main():
     """This is the main CLI entry point."""
-    multiprocessing.set_start_method("fork")
     args = parse_args()
     config_cli(args)
 
@@ -1,9 +1,10 @@
+import mmap
 import struct
 try:
     from multiprocessing.shared_memory import SharedMemory  # type: ignore
 except ImportError:
     from getm.concurrent.shared_memory_37.shared_memory import SharedMemory  # type: ignore
-from typing import ByteString, Optional, Tuple
+from typing import Optional, Tuple, Union
 
 # TODO
 # Assignment to memoryview slices annoys mypy
@@ -14,19 +15,32 @@ from typing import ByteString, Optional, Tuple
 
 COORD_FMT = "@q"
 COORD_FIELD_SZ = struct.calcsize(COORD_FMT)
+PAGE_SZ = mmap.PAGESIZE
 
 class SharedCircularBuffer:
+    """Circular buffer in multiprocessing shared memory. The data region starts at offset 0, keeping it page aligned,
+    and is padded to a whole number of pages. The 'start' and 'stop' coordinates, and the buffer size, are stored on a
+    trailing page.
+    """
     def __init__(self, name: Optional[str]=None, size: int=0, create=False):
         if create is True:
-            self._shared_memory = SharedMemory(create=True, size=size + 2 * COORD_FIELD_SZ)
+            self._shared_memory = SharedMemory(create=True, size=-(-size // PAGE_SZ) * PAGE_SZ + PAGE_SZ)
             self._did_create = True
         else:
             self._shared_memory = SharedMemory(name)
         self._view = self._shared_memory.buf
+        # The coordinates are read and written on every turn of the producer/consumer loop: cast once
+        fields_start = self._shared_memory.size - PAGE_SZ
+        self._coords = self._view[fields_start:fields_start + 3 * COORD_FIELD_SZ].cast("q")
+        if create is True:
+            self._coords[2] = size
+        self._data_end = self._coords[2]
+        # Wrap with a bitmask instead of '%' when the buffer size is a power of two
+        self._mask = self._data_end - 1 if not self._data_end & (self._data_end - 1) else None
 
     @property
     def size(self):
-        return self._shared_memory.size - 2 * COORD_FIELD_SZ
+        return self._data_end
 
     @property
     def name(self):
@@ -34,27 +48,29 @@ class SharedCircularBuffer:
 
     @property
     def start(self):
-        start, = struct.unpack(COORD_FMT, self._shared_memory.buf[-2 * COORD_FIELD_SZ:-COORD_FIELD_SZ])
-        return start
+        return self._coords[0]
 
     @start.setter
     def start(self, val):
-        self._shared_memory.buf[-2 * COORD_FIELD_SZ:-COORD_FIELD_SZ] = struct.pack(COORD_FMT, val)
+        self._coords[0] = val
 
     @property
     def stop(self):
-        stop, = struct.unpack(COORD_FMT, self._shared_memory.buf[-COORD_FIELD_SZ:])
-        return stop
+        return self._coords[1]
 
     @stop.setter
     def stop(self, val):
-        self._shared_memory.buf[-COORD_FIELD_SZ:] = struct.pack(COORD_FMT, val)
+        self._coords[1] = val
 
     def _circular_coords(self, slc: slice) -> Tuple[int, int, bool]:
-        if self.size < slc.stop - slc.start:
+        if self._data_end < slc.stop - slc.start:
             raise ValueError("Not enough space in buffer")
-        start = slc.start % self.size
-        stop = slc.stop % self.size
+        if self._mask is not None:
+            start = slc.start & self._mask
+            stop = slc.stop & self._mask
+        else:
+            start = slc.start % self._data_end
+            stop = slc.stop % self._data_end
         wraps = stop <= start or (slc.start != slc.stop and start == stop)
         return start, stop, wraps
 
@@ -63,22 +79,26 @@ class SharedCircularBuffer:
             raise ValueError("zero length slice not allowed")
         start, stop, wraps = self._circular_coords(slc)
         if wraps:
-            return self._view[start:-2 * COORD_FIELD_SZ]
+            return self._view[start:self._data_end]
         else:
             return self._view[start:stop]
 
-    def __setitem__(self, slc: slice, data: bytes):
+    def __setitem__(self, slc: slice, data: Union[bytes, bytearray, memoryview]):
         start, stop, wraps = self._circular_coords(slc)
+        # View 'data' as flat bytes: slices are then zero-copy, and any contiguous buffer, e.g. an 'array.array' or
+        # a multi-byte memoryview, is copied in with a single memmove rather than converted first.
+        view = memoryview(data).cast("B")
         if wraps:
-            wrap_length = self.size - start
-            self._view[start:-2 * COORD_FIELD_SZ] = data[:wrap_length]  # type: ignore # TODO remove after mypy 0.812
-            self._view[:len(data) - wrap_length] = data[wrap_length:]  # type: ignore # TODO remove after mypy 0.812
+            wrap_length = self._data_end - start
+            self._view[start:self._data_end] = view[:wrap_length]  # type: ignore # TODO remove after mypy 0.812
+            self._view[:len(view) - wrap_length] = view[wrap_length:]  # type: ignore # TODO remove after mypy 0.812
         else:
-            self._view[start:stop] = data  # type: ignore # TODO remove after mypy 0.812
+            self._view[start:stop] = view  # type: ignore # TODO remove after mypy 0.812
 
     def close(self):
         if self._shared_memory is not None:
             sm, self._shared_memory = self._shared_memory, None
+            self._coords.release()
             sm.close()
             if getattr(self, "_did_create", False):
                 sm.unlink()
@@ -89,8 +109,8 @@ class SharedCircularBuffer:
     def __exit__(self, *args, **kwargs):
         self.close()
 
-STRIDE_FMT = "@LL"
-STRIDE_SZ = struct.calcsize(STRIDE_FMT)
+STRIDE_FMT = "@L"
+STRIDE_SZ = 2 * struct.calcsize(STRIDE_FMT)
 
 class SharedBufferArray:
     def __init__(self, name: Optional[str]=None, chunk_size: int=0, num_chunks: int=0, create=False):
@@ -101,14 +121,23 @@ class SharedBufferArray:
             self._did_create = True
         else:
             self._shared_memory = SharedMemory(name)
-            self._get_stride_info()
+            if chunk_size and num_chunks:
+                # The caller knows the layout, skip reading it from shared memory
+                self.chunk_size, self.num_chunks = chunk_size, num_chunks
+            else:
+                self._get_stride_info()
+        # Slice each chunk once, here, rather than on every access
+        self._chunks = tuple(self._shared_memory.buf[i * self.chunk_size: (i + 1) * self.chunk_size]
+                             for i in range(self.num_chunks))
 
     def _set_stride_info(self, chunk_size: int, num_chunks: int):
-        self._shared_memory.buf[-STRIDE_SZ:] = struct.pack(STRIDE_FMT, chunk_size, num_chunks)  # type: ignore # TODO remove after mypy 0.812  # noqa
+        with self._shared_memory.buf[-STRIDE_SZ:].cast("L") as stride:
+            stride[0], stride[1] = chunk_size, num_chunks
         self.chunk_size, self.num_chunks = chunk_size, num_chunks
 
     def _get_stride_info(self):
-        self.chunk_size, self.num_chunks = struct.unpack(STRIDE_FMT, self._shared_memory.buf[-STRIDE_SZ:])
+        with self._shared_memory.buf[-STRIDE_SZ:].cast("L") as stride:
+            self.chunk_size, self.num_chunks = stride
 
     @property
     def size(self):
@@ -119,14 +148,14 @@ class SharedBufferArray:
         return self._shared_memory.name
 
     def __getitem__(self, i: int) -> memoryview:
-        if i < self.num_chunks:
-            return self._shared_memory.buf[i * self.chunk_size: (i + 1) * self.chunk_size]
-        else:
-            raise IndexError()
+        # Return a new view of the cached chunk: callers may release it without invalidating the chunk for others
+        return self._chunks[i][:]
 
     def close(self):
         if self._shared_memory is not None:
             sm, self._shared_memory = self._shared_memory, None
+            for chunk in self._chunks:
+                chunk.release()
             sm.close()
             if getattr(self, "_did_create", False):
                 sm.unlink()
@@ -1,12 +1,17 @@
 """Provide objects to manage results from concurrent operations using Executor."""
 import heapq
+from queue import SimpleQueue
+from itertools import count
+from threading import BoundedSemaphore
 from collections import deque
 from multiprocessing import cpu_count
-from concurrent.futures import Future, as_completed, wait, Executor, FIRST_COMPLETED
-from typing import Any, Callable, Deque, Generator, List, Optional, Set
+from concurrent.futures import Future, wait, Executor
+from typing import Any, Callable, Collection, Deque, Generator, List, Optional, Set
 
 
 class _ConcurrentCollection:
+    _futures: Collection[Future]
+
     def __init__(self, executor: Executor, concurrency: int=0):
         self.executor = executor
         self.concurrency = concurrency
@@ -31,48 +36,56 @@ class _ConcurrentCollection:
         raise NotImplementedError()
 
     def running(self) -> List[Future]:
-        return [f for f in getattr(self, "_futures", list()) if not f.done()]
+        return [f for f in self._futures if not f.done()]
 
     def abort(self):
-        futures = getattr(self, "_futures", list())
-        for f in futures:
-            f.cancel()
-        wait(futures)
+        # Only futures that could not be cancelled are still running, and need to be waited on
+        wait([f for f in self._futures if not f.cancel()])
+
+    def __enter__(self):
+        return self
 
-    def __del__(self):
+    def __exit__(self, *args, **kwargs):
         self.abort()
 
 class ConcurrentPool(_ConcurrentCollection):
     """Unordered collection providing results of concurrent operations. Up to 'concurrency' operations are executed in
-    parallel.
+    parallel. 'put' blocks while 'concurrency' operations are running. Finished operations free their slot whether or
+    not their results have been consumed, so a single thread may put and then get without deadlock.
     """
     def __init__(self, executor: Executor, concurrency: int=cpu_count()):
         super().__init__(executor, concurrency)
         self._futures: Set[Future] = set()
+        # Futures report completion through callbacks, avoiding a scan of every future for each 'put' and 'get'
+        self._slots = BoundedSemaphore(concurrency)
+        self._completed: SimpleQueue = SimpleQueue()
 
     def __len__(self):
         return len(self._futures)
 
     def put(self, func: Callable, *args, **kwargs):
-        running = len(self.running())
-        self._wait(running - self.concurrency)
-        self._futures.add(self.executor.submit(func, *args, **kwargs))
+        self._slots.acquire()
+        try:
+            f = self.executor.submit(func, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        self._futures.add(f)
+        f.add_done_callback(self._on_done)
+
+    def _on_done(self, f: Future):
+        self._slots.release()
+        self._completed.put(f)
 
     def get(self) -> Any:
         if self._futures:
-            f = wait(self._futures, return_when=FIRST_COMPLETED).done.pop()
+            f = self._completed.get()
             self._futures.remove(f)
             return f.result()
 
-    def __iter__(self) -> Any:
+    def __iter__(self) -> Generator[Any, None, None]:
         while self._futures:
-            for f in as_completed(self._futures):
-                self._futures.remove(f)
-                yield f.result()
-
-    def _wait(self, count: int=-1):
-        for f, _ in zip(as_completed(self._futures), range(count)):
-            pass
+            yield self.get()
 
 class ConcurrentQueue(_ConcurrentCollection):
     """FIFO queue providing results of concurrent operations in the order they were submitted. Up to 'concurrency'
@@ -108,38 +121,48 @@ class ConcurrentHeap(_ConcurrentCollection):
     """Priority queue providing results of concurrent operations in prioritized order. Up to 'concurrency' operations
     are executed in parallel. New operations are executed as available results are consumed.
     """
+    default_priority = 1
+
     def __init__(self, executor: Executor, concurrency: int=cpu_count()):
         super().__init__(executor, concurrency)
         self._futures: Set[Future] = set()
         self._scheduled: List[Any] = list()
-        self._item_id = 0
+        # Operations with the default priority are kept in FIFO order without heap operations
+        self._scheduled_default: Deque[Any] = deque()
+        self._item_ids = count()
+        self._completed: SimpleQueue = SimpleQueue()
 
     def __len__(self):
-        return len(self._scheduled) + len(self._futures)
+        return len(self._scheduled) + len(self._scheduled_default) + len(self._futures)
 
     def _submit(self):
-        while len(self._futures) < self.concurrency and self._scheduled:
-            _, func, args, kwargs = heapq.heappop(self._scheduled)
-            self._futures.add(self.executor.submit(func, *args, **kwargs))
+        while len(self._futures) < self.concurrency and (self._scheduled or self._scheduled_default):
+            if self._scheduled_default and (not self._scheduled or -self._scheduled[0][0] <= self.default_priority):
+                func, args, kwargs = self._scheduled_default.popleft()
+            else:
+                _, _, func, args, kwargs = heapq.heappop(self._scheduled)
+            f = self.executor.submit(func, *args, **kwargs)
+            self._futures.add(f)
+            f.add_done_callback(self._completed.put)
 
     def priority_put(self, priority: int, func: Callable, *args, **kwargs):
         # heapq implements a min queue. Negate the priority so heapq.heappop produces the expected ordering
         # see priority queue docs: https://docs.python.org/3/library/heapq.html#priority-queue-implementation-notes
-        q_priority = (-1 * priority, self._item_id)
-        self._item_id += 1
-        heapq.heappush(self._scheduled, (q_priority, func, args, kwargs))
+        # Entries are flat tuples: comparisons are settled by the two leading ints, which are unique together.
+        if self.default_priority == priority:
+            self._scheduled_default.append((func, args, kwargs))
+        else:
+            heapq.heappush(self._scheduled, (-priority, next(self._item_ids), func, args, kwargs))
         self._submit()
 
     def put(self, func: Callable, *args, **kwargs):
         """Queue 'func' with priority 1."""
-        self.priority_put(1, func, *args, **kwargs)
+        self.priority_put(self.default_priority, func, *args, **kwargs)
 
     def _get(self) -> Optional[Future]:
-        f: Optional[Future] = None
-        if self._futures:
-            for f in as_completed(self._futures):
-                self._futures.remove(f)
-                break
+        f: Optional[Future] = self._completed.get() if self._futures else None
+        if f is not None:
+            self._futures.remove(f)
         self._submit()
         return f
 
@@ -148,11 +171,11 @@ class ConcurrentHeap(_ConcurrentCollection):
         return f.result() if f is not None else None
 
     def __iter__(self) -> Generator[Any, None, None]:
-        while self._scheduled or self._futures:
+        while self._scheduled or self._scheduled_default or self._futures:
             yield self.get()
 
     def iter_futures(self) -> Generator[Future, None, None]:
-        while self._scheduled or self._futures:
+        while self._scheduled or self._scheduled_default or self._futures:
             f = self._get()
             if f is not None:
                 yield f
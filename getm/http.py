@@ -1,44 +1,88 @@
 import requests
 import warnings
-from functools import lru_cache
+import threading
+from collections import OrderedDict
 from urllib.parse import urlparse
-from typing import Generator, Optional, Tuple
+from typing import Dict, Generator, Optional, Tuple
 
 from requests import codes
 from requests.exceptions import HTTPError
 from requests.adapters import HTTPAdapter
 from requests.packages.urllib3.util.retry import Retry
+from requests.packages.urllib3.exceptions import ProtocolError
 
 
 default_retry = Retry(total=10,
                       status_forcelist=[429, 500, 502, 503, 504],
                       method_whitelist=["HEAD", "GET"])
 
+# Connections kept alive per host. Downloads on many threads share a session: with urllib3's default of 10,
+# connections beyond that are discarded after each request, and replaced with fresh TCP/TLS handshakes.
+default_pool_maxsize = 64
+
 class Session(requests.Session):
+    head_cache_size = 20
+
+    def __init__(self):
+        super().__init__()
+        self._head_cache: OrderedDict[str, Dict[str, str]] = OrderedDict()
+        self._head_lock = threading.Lock()
+
     def get_range_readinto(self, url: str, start: int, size: int, buf: memoryview):
+        # Transport errors and error statuses are retried by the mounted adapter. Read each response until it is
+        # exhausted, and only issue another request, for the remaining range, if the part is still incomplete.
+        pos = 0
         for _ in range(10):
-            with self.get(url, headers=dict(Range=f"bytes={start}-{start + size - 1}"), stream=True) as resp:
+            with self.get(url, headers=dict(Range=f"bytes={start + pos}-{start + size - 1}"), stream=True) as resp:
                 resp.raise_for_status()
-                # Occasionally an incomplete part is provided with OK status. Check size and retry.
-                # Note: Persistent read/readinto on existing connection does not seem to work.
-                if size == resp.raw.readinto(buf):
-                    break
-                else:
-                    msg = ("HTTP range request returned incomplete part. Retrying "
-                           f"size={size} "
-                           f"content-length={resp.headers['Content-Length']} "
-                           f"status-code={resp.status_code}")
-                    warnings.warn(msg)
+                content_length = int(resp.headers.get('Content-Length', size - pos))
+                if content_length != size - pos:
+                    raise ValueError(f"HTTP range request returned content-length={content_length} "
+                                     f"for {size - pos} bytes")
+                try:
+                    # Read through urllib3, which returns the connection to the pool once the response is exhausted
+                    while pos < size:
+                        bytes_read = resp.raw.readinto(buf[pos:size])
+                        if not bytes_read:
+                            break
+                        pos += bytes_read
+                except (ConnectionError, ProtocolError):
+                    pass
+            if size == pos:
+                break
+            warnings.warn("HTTP range request returned incomplete part. Resuming "
+                          f"size={size} "
+                          f"received={pos} "
+                          f"status-code={resp.status_code}")
         else:
             raise Exception("Failed to download part")
 
-    @lru_cache(maxsize=20)
-    def head(self, url: str):  # type: ignore
-        """Return the headers from a GET request."""
-        # HEAD on S3 signed urls does no include "Content-Length", so we use GET instead
+    def head(self, url: str) -> Dict[str, str]:  # type: ignore
+        """Return the headers from a HEAD request, falling back to GET, as a dict with lower-cased header names.
+        Headers are cached for the most recently used urls, evicting the least recently used.
+        """
+        with self._head_lock:
+            headers = self._head_cache.get(url)
+            if headers is not None:
+                self._head_cache.move_to_end(url)
+                return headers
+        headers = self._head(url)
+        with self._head_lock:
+            self._head_cache[url] = headers
+            while len(self._head_cache) > self.head_cache_size:
+                self._head_cache.popitem(last=False)
+        return headers
+
+    def _head(self, url: str) -> Dict[str, str]:
+        # Signed S3 and GS urls are signed for GET only, and HEAD on S3 signed urls does not include "Content-Length".
+        # Other servers may not support HEAD. In those cases use GET, without reading the body.
+        if "Signature=" not in urlparse(url).query:
+            resp = super().head(url, allow_redirects=True)
+            if resp.ok and 'Content-Length' in resp.headers:
+                return {k.lower(): v for k, v in resp.headers.items()}
         with self.get(url, stream=True) as resp:
             resp.raise_for_status()
-            return resp.headers
+            return {k.lower(): v for k, v in resp.headers.items()}
 
     def accessable(self, url: str) -> Tuple[bool, Optional[requests.Response]]:
         """Probe 'url' for a normal response. Upon error, grab the full reponse. In the case of S3 and GS signed URLs,
@@ -55,7 +99,7 @@ class Session(requests.Session):
                 raise
 
     def size(self, url: str) -> int:
-        return int(self.head(url)['Content-Length'])
+        return int(self.head(url)['content-length'])
 
     def iter_content(self, url: str, chunk_size: int) -> Generator[bytes, None, None]:
         with self.get(url, stream=True) as resp:
@@ -69,10 +113,11 @@ class Session(requests.Session):
         2. Use the last path component of the 'path' field returned from urllib.parse.urlparse
         """
         name = ""
-        content_disposition = self.head(url).get('Content-Disposition', "")
+        content_disposition = self.head(url).get('content-disposition', "")
         for part in content_disposition.split(";"):
-            if part.strip().startswith("filename"):
-                name = part.split("=", 1)[-1].strip("'\"")
+            key, sep, val = part.partition("=")
+            if key.strip().startswith("filename"):
+                name = (val if sep else key).strip("'\"")
                 break
         name = name or urlparse(url).path.rsplit("/", 1)[-1]
         if name:
@@ -99,25 +144,25 @@ class Session(requests.Session):
         checksums = dict()
         if 'x-goog-hash' in headers:
             for part in headers['x-goog-hash'].split(","):
-                name, val = part.strip().split("=", 1)
+                name, _, val = part.strip().partition("=")
                 if "crc32c" == name:
                     checksums['gs_crc32c'] = val
                 if "md5" == name:
                     checksums['gs_md5'] = val
-        if 'ETag' in headers:
-            etag = headers['ETag'].strip("\"")
-            if "AmazonS3" in headers.get('Server', ""):
+        if 'etag' in headers:
+            etag = headers['etag'].strip("\"")
+            if "AmazonS3" in headers.get('server', ""):
                 checksums['s3_etag'] = etag
             else:
                 checksums['etag'] = etag
-        if 'Content-MD5' in headers:
-            checksums['md5'] = headers['Content-MD5']
+        if 'content-md5' in headers:
+            checksums['md5'] = headers['content-md5']
         return checksums
 
-def http_session(session: Session=None, retry: Retry=None) -> Session:
+def http_session(session: Session=None, retry: Retry=None, pool_maxsize: int=default_pool_maxsize) -> Session:
     session = session or Session()
     retry = retry or default_retry
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount("https://", adapter)
     session.mount("http://", adapter)
     return session
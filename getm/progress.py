@@ -1,23 +1,28 @@
+import sys
 import time
 import logging
+from queue import SimpleQueue
 from math import ceil, floor
-from multiprocessing import Lock
-from typing import Callable
+from threading import Lock, Thread
+from typing import Callable, Optional, Tuple
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 ChunkerCallback = Callable[[int, int, float], None]
 
+_units = ('', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi', 'Yi')
+
 def sizeof_fmt(num, suffix='B'):
     assert 0 <= num
-    for unit in ['', 'Ki', 'Mi', 'Gi', 'Ti', 'Pi', 'Ei', 'Zi']:
-        if num < 1024:
-            return "%3.1f%s%s" % (num, unit, suffix)
-        num /= 1024
-    return "%.1f%s%s" % (num, 'Yi', suffix)
+    # Select the unit from the bit length of the integral part rather than repeatedly dividing by 1024
+    idx = min((max(1, int(num)).bit_length() - 1) // 10, len(_units) - 1)
+    return "%3.1f%s%s" % (num / (1 << (10 * idx)), _units[idx], suffix)
 
 class Chunker:
+    """Report progress to 'callback' as each chunk of 'size' completes. Not thread safe: each download adds progress
+    from a single thread.
+    """
     def __init__(self, size: int, chunk_size: float, callback: ChunkerCallback):
         self.size = size
         self.chunk_size = chunk_size
@@ -25,15 +30,22 @@ class Chunker:
         self.callback = callback
         self.progress = 0
         self.chunks_completed = 0
+        # Progress at which the next chunk completes. Progress is integral, so rounding the threshold up is exact and
+        # keeps the comparison in 'add' between ints.
+        self._next_progress = min(ceil(chunk_size), size)
         self.start = time.time()
 
     def add(self, sz: int):
         self.progress += sz
+        if self.progress < self._next_progress:
+            # 'add' is called for every part downloaded, typically well short of the next chunk
+            return
         if self.size < self.progress:
             raise ValueError("More than 100% progress!")
         chunks_completed = self.num_chunks if self.size == self.progress else floor(self.progress / self.chunk_size)
         if chunks_completed > self.chunks_completed:
             self.chunks_completed = chunks_completed
+            self._next_progress = min(ceil((chunks_completed + 1) * self.chunk_size), self.size)
             duration = time.time() - self.start
             self.callback(self.size, self.progress, duration)
 
@@ -46,7 +58,7 @@ class ProgressIndicator:
     def __init__(self, name: str, size: int, increments: int=40):
         self.name = name
         self._chunker = Chunker(size, self.chunker_chunk_size, self._print)
-        self._downloaded_field_width = len(f"{size}")
+        self._size_fmt = sizeof_fmt(size)
 
     def add(self, sz: int):
         self._chunker.add(sz)
@@ -63,35 +75,82 @@ class ProgressIndicator:
             self.add(0)
 
 class ProgressBar(ProgressIndicator):
+    min_print_interval = 0.05  # seconds
+
     def __init__(self, name: str, size: int, increments: int=40):
         super().__init__(name, size, increments)
         self._lock = Lock()
         self.name = self.name[:40]
-        self._chunk_size = size / increments
+        self._increments = increments
+        self._bars = tuple("=" * i + " " * (increments - i) for i in range(increments + 1))
+        self._last_print = 0.0
+        # Bars are drawn by a renderer thread so downloads never block on stdout
+        self._redraws: SimpleQueue = SimpleQueue()
+        self._renderer = Thread(target=self._render, daemon=True)
+        self._render_error: Optional[Exception] = None
 
     def _print(self, size: int, progress: int, duration: float):
-        if progress == size:
-            chunks_completed = ceil(progress / self._chunk_size)
-            chunks_remaining = 0
-        else:
-            chunks_completed = floor(progress / self._chunk_size)
-            chunks_remaining = ceil(size / self._chunk_size) - chunks_completed
-        bar = "{name}   {percent:3d}%   [{parts}]   {size}   {rate}/s   {duration:.2f}s".format(
-            name=self.name,
-            percent=floor(progress / size * 100),
-            parts="=" * chunks_completed + " " * chunks_remaining,
-            size=sizeof_fmt(size),
-            rate=sizeof_fmt(progress / duration),  # integrated rate
-            duration=duration,
-        )
+        # On fast links chunks complete far more often than a terminal can usefully redraw. Always draw completion.
+        now = time.monotonic()
+        if progress < size and now - self._last_print < self.min_print_interval:
+            return
+        self._last_print = now
+        self._redraws.put((size, progress, duration))
+
+    def _render(self):
+        redraw: Optional[Tuple[int, int, float]] = self._redraws.get()
+        while redraw is not None:
+            # Only the most recent of any queued redraws is drawn
+            while not self._redraws.empty():
+                latest = self._redraws.get()
+                if latest is None:
+                    self._render_one(redraw)
+                    return
+                redraw = latest
+            self._render_one(redraw)
+            redraw = self._redraws.get()
+
+    def _render_one(self, redraw: Tuple[int, int, float]):
+        # After a failed draw the queue keeps draining without drawing. The error is raised from '__exit__'.
+        if self._render_error is None:
+            try:
+                self._draw(*redraw)
+            except Exception as e:
+                self._render_error = e
+
+    def _draw(self, size: int, progress: int, duration: float):
+        percent, parts = progress * 100 // size, self._bars[progress * self._increments // size]
+        rate = sizeof_fmt(progress / duration)  # integrated rate
+        self._write(f"\r {self.name}   {percent:3d}%   [{parts}]   {self._size_fmt}   {rate}/s   {duration:.2f}s")
+
+    def _write(self, text: str):
+        # Progress is drawn by threads of a single process. Write encoded bytes straight to the binary buffer when
+        # available, skipping the extra work of 'print'.
         with self._lock:
-            print("\r", bar, end="", flush=True)
+            out = getattr(sys.stdout, "buffer", None)
+            if out is None:
+                sys.stdout.write(text)
+                sys.stdout.flush()
+            else:
+                sys.stdout.flush()  # preserve ordering with any pending text output
+                out.write(text.encode())
+                out.flush()
+
+    def __enter__(self):
+        self._renderer.start()
+        return super().__enter__()
 
     def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                self.add(0)
+        finally:
+            self._redraws.put(None)
+            self._renderer.join()
         if exc_type is None:
-            self.add(0)
-            with self._lock:
-                print(flush=True)
+            if self._render_error is not None:
+                raise self._render_error
+            self._write("\n")
 
 class ProgressLogger(ProgressIndicator):
     def __init__(self, name: str, size: int, increments: int=40):
@@ -99,11 +158,5 @@ class ProgressLogger(ProgressIndicator):
         super().__init__(name, size, increments)
 
     def _print(self, size, progress, duration):
-        bar = "{name} {percent:3d}% {size} {rate}/s {duration:.6f}s".format(
-            name=self.name,
-            percent=floor(progress / size * 100),
-            size=sizeof_fmt(size),
-            rate=sizeof_fmt(progress / duration),  # integrated rate
-            duration=duration
-        )
-        logger.info(bar)
+        percent, rate = progress * 100 // size, sizeof_fmt(progress / duration)  # integrated rate
+        logger.info(f"{self.name} {percent:3d}% {self._size_fmt} {rate}/s {duration:.6f}s")
@@ -1,17 +1,38 @@
 import io
-import time
+import os
+import ctypes
 import warnings
-from math import ceil
-from collections import deque
-from multiprocessing import Process
-from concurrent.futures import ProcessPoolExecutor
-from typing import Optional, Generator, Tuple
+import multiprocessing
+from functools import lru_cache
+from itertools import islice
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Optional, Generator, Tuple, Union
 
-from getm.http import http, http_session
+from getm.http import Session, http, http_session
 from getm.utils import available_shared_memory
 from getm.concurrent import ConcurrentQueue, ConcurrentPool, SharedCircularBuffer, SharedBufferArray
 
 
+@lru_cache(maxsize=1)
+def _worker_session(pid: int) -> Session:
+    # Part workers share one session per process, reusing pooled connections across parts. Keyed on process id: pooled
+    # connections must not be shared with forked processes.
+    return http_session()
+
+# Copies at least this large are made with the GIL released
+GIL_FREE_COPY_SIZE = 256 * 1024
+
+def _copy_into(dst: Union[bytearray, memoryview], src: memoryview):
+    size = len(src)
+    if GIL_FREE_COPY_SIZE > size:
+        dst[:size] = src
+    else:
+        # ctypes releases the GIL for foreign calls, letting other threads run during the copy
+        dst_arr = (ctypes.c_char * size).from_buffer(dst)
+        src_arr = (ctypes.c_char * size).from_buffer(src)
+        ctypes.memmove(dst_arr, src_arr, size)
+        del dst_arr, src_arr  # drop buffer exports before the caller releases 'src'
+
 class BaseURLReader(io.IOBase):
     def readable(self):
         return True
@@ -34,51 +55,116 @@ class BaseURLReader(io.IOBase):
     def write(self, *args, **kwargs):
         raise OSError()
 
+# urllib3 reads into a temporary bytes object the size of the destination, then copies it: bound each read
+RAW_READ_SIZE = 1024 * 1024
+
 class URLRawReader(BaseURLReader):
-    def __init__(self, url: str):
-        self.size = http.size(url)
+    def __init__(self, url: str, size: Optional[int]=None):
         self._resp = http.get(url, stream=True)
         self._resp.raise_for_status()
+        if size is None:
+            # Take the size from the response when available, avoiding a separate HEAD request
+            content_length = self._resp.headers.get('Content-Length')
+            size = http.size(url) if content_length is None else int(content_length)
+        self.size = size
         self.handle = self._resp.raw
+        self._bytes_read = 0
 
     def read(self, sz: int=-1) -> memoryview:
-        if -1 == sz:
-            sz = self.size
-        d = self.handle.read(sz)
-        return memoryview(d)
+        """Read at most 'sz' bytes from stream as a memoryview object. Each read returns a new buffer. The caller is
+        expected to call 'release' on each such object.
+        """
+        # Never allocate beyond the end of the object
+        remaining = max(0, self.size - self._bytes_read)
+        sz = remaining if -1 == sz else min(sz, remaining)
+        buf = memoryview(bytearray(sz))
+        try:
+            bytes_read = 0
+            while bytes_read < sz:
+                length = self.handle.readinto(buf[bytes_read: bytes_read + RAW_READ_SIZE])
+                if not length:
+                    break
+                bytes_read += length
+            self._bytes_read += bytes_read
+            return buf[:bytes_read]
+        finally:
+            buf.release()
 
     def readinto(self, buff: bytearray) -> int:
-        return self.handle.readinto(buff)
+        bytes_read = self.handle.readinto(buff)
+        self._bytes_read += bytes_read
+        return bytes_read
 
     def close(self):
         self._resp.close()
         super().close()
 
     @classmethod
-    def iter_content(cls, url: str, chunk_size: int):
-        for part_id, part in enumerate(http.iter_content(url, chunk_size=chunk_size)):
-            part = memoryview(part)
+    def iter_content(cls,
+                     url: str,
+                     chunk_size: int,
+                     size: Optional[int]=None) -> Generator[memoryview, None, None]:
+        """Yield parts in order. Parts are 'memoryview' objects referencing a single buffer that is reused for every
+        part, avoiding an allocation per part. Provide 'size' if already known.
+
+        Content encoded by the server, e.g. with gzip, is decoded. Decoded parts are not read into a reused buffer.
+        """
+        with cls(url, size) as reader:
+            if reader._resp.headers.get('Content-Encoding', "identity") != "identity":
+                for data in reader._resp.iter_content(chunk_size=chunk_size):
+                    part = memoryview(data)
+                    try:
+                        yield part
+                    finally:
+                        part.release()
+                return
+            buf = memoryview(bytearray(min(chunk_size, reader.size)))
             try:
-                yield part
+                while True:
+                    bytes_read = reader.handle.readinto(buf)
+                    if not bytes_read:
+                        break
+                    part = buf[:bytes_read]
+                    try:
+                        yield part
+                    finally:
+                        part.release()
             finally:
-                part.release()
+                buf.release()
 
 class URLReader(BaseURLReader):
     """Provide a streaming object to bytes referenced by 'url'. Chunks of data are pre-fetched in the background with
-    concurrency='concurrency'.
+    concurrency='concurrency'. Range requests are I/O bound, and are made on threads. A long-lived 'executor' may be
+    provided, avoiding starting workers for each reader. Otherwise one is created and shut down with the reader.
     """
-    def __init__(self, url: str, chunk_size: int, concurrency: int):
+    def __init__(self,
+                 url: str,
+                 chunk_size: int,
+                 concurrency: int,
+                 size: Optional[int]=None,
+                 executor: Optional[Executor]=None):
         self.chunk_size, buffer_size = self._compute_chunk_and_buf_size(concurrency, chunk_size)
         assert 1 <= concurrency
         self.url = url
-        self.size = http.size(url)
+        self.size = http.size(url) if size is None else size
         self._start = self._stop = 0
         self._buf = SharedCircularBuffer(size=buffer_size, create=True)
         self.max_read = concurrency * self.chunk_size
-        self.executor = ProcessPoolExecutor(max_workers=concurrency)
+        self._owns_executor = executor is None
+        self.executor = executor or ThreadPoolExecutor(max_workers=concurrency)
         self.future_parts = ConcurrentQueue(self.executor, concurrency=concurrency)
-        for part_coord in part_coords(self.size, self.chunk_size):
-            self.future_parts.put(self._fetch_part, self.url, *part_coord, self._buf.name)
+        # Thread workers write through this reader's buffer. Workers in other processes attach to it by name.
+        self._part_buf = self._buf.name if isinstance(self.executor, ProcessPoolExecutor) else self._buf
+        # Parts are scheduled as results are consumed, rather than all up front
+        self._part_coords = part_coords(self.size, self.chunk_size)
+        for part_coord in islice(self._part_coords, concurrency):
+            self.future_parts.put(self._fetch_part, self.url, *part_coord, self._part_buf)
+
+    def _get_part(self) -> Tuple[int, int, int]:
+        res = self.future_parts.get()
+        for part_coord in islice(self._part_coords, 1):
+            self.future_parts.put(self._fetch_part, self.url, *part_coord, self._part_buf)
+        return res
 
     @classmethod
     def _compute_chunk_and_buf_size(cls, concurrency: int, proposed_chunk_size: int) -> Tuple[int, int]:
@@ -100,14 +186,15 @@ class URLReader(BaseURLReader):
         """Read at most 'sz' bytes from stream as a memoryview object referencing multiprocessing shared memory. The
         caller is expected to call 'release' on each such object.
         """
-        if -1 == sz:
-            sz = self.size
-        # avoid overwite in circular buffer
-        sz = min(sz, self.max_read)
-        while sz > self._stop - self._start and len(self.future_parts):
-            _, _, part_size = self.future_parts.get()
+        if -1 == sz or sz > self.max_read:
+            sz = self.max_read  # avoid overwite in circular buffer
+        available = self._stop - self._start
+        while sz > available and self.future_parts:
+            _, _, part_size = self._get_part()
             self._stop += part_size
-        sz = min(sz, self._stop - self._start)  # don't overflow end of data
+            available += part_size
+        if sz > available:
+            sz = available  # don't overflow end of data
         if sz:
             res = self._buf[self._start: self._start + sz]
             self._start += len(res)
@@ -118,22 +205,43 @@ class URLReader(BaseURLReader):
     def readinto(self, buff: bytearray) -> int:
         d = self.read(len(buff))
         bytes_read = len(d)
-        buff[:bytes_read] = d
+        _copy_into(buff, d)
         d.release()
         return bytes_read
 
     def close(self):
-        self.executor.shutdown()
+        if self._owns_executor:
+            self.executor.shutdown()
+        else:
+            self.future_parts.abort()
         self._buf.close()
         super().close()
 
     @classmethod
-    def iter_content(cls, url: str, chunk_size: int, concurrency: int) -> Generator[memoryview, None, None]:
+    def iter_content(cls,
+                     url: str,
+                     chunk_size: int,
+                     concurrency: int,
+                     size: Optional[int]=None,
+                     executor: Optional[Executor]=None) -> Generator[memoryview, None, None]:
         """Fetch parts and yield in order, pre-fetching with concurrency equal to `concurrency`. Parts are 'memoryview'
-        objects that reference multiprocessing shared memory.
+        objects that reference multiprocessing shared memory. Provide 'size' if already known.
+
+        Objects that fit in a single part are fetched with one range request on the calling thread instead.
         """
-        with cls(url, chunk_size, concurrency) as reader:
-            for part_id, start, part_size in reader.future_parts:
+        size = http.size(url) if size is None else size
+        if 0 < size <= chunk_size:
+            # No workers or shared memory, but the same size checks and resumption as any other part
+            part = memoryview(bytearray(size))
+            try:
+                http.get_range_readinto(url, 0, size, part)
+                yield part
+            finally:
+                part.release()
+            return
+        with cls(url, chunk_size, concurrency, size, executor) as reader:
+            while reader.future_parts:
+                part_id, start, part_size = reader._get_part()
                 part = reader._buf[start: start + part_size]
                 try:
                     yield part
@@ -141,49 +249,81 @@ class URLReader(BaseURLReader):
                     part.release()
 
     @staticmethod
-    def _fetch_part(url: str, part_id: int, start: int, part_size: int, sb_name: str) -> Tuple[int, int, int]:
-        # This method is executed in subprocesses. Rerferences to global variables should be avoided.
+    def _fetch_part(url: str,
+                    part_id: int,
+                    start: int,
+                    part_size: int,
+                    sb: Union[SharedCircularBuffer, str]) -> Tuple[int, int, int]:
+        # This method may be executed in subprocesses. Rerferences to global variables should be avoided.
         # See https://docs.python.org/3/library/multiprocessing.html#programming-guidelines
-        buf = SharedCircularBuffer(sb_name)
-        http_session().get_range_readinto(url, start, part_size, buf[start: start + part_size])
+        # Only subprocesses attach to the shared memory by name.
+        buf = SharedCircularBuffer(sb) if isinstance(sb, str) else sb
+        try:
+            part = buf[start: start + part_size]
+            try:
+                _worker_session(os.getpid()).get_range_readinto(url, start, part_size, part)
+            finally:
+                part.release()
+        finally:
+            if buf is not sb:
+                buf.close()
         return part_id, start, part_size
 
 READ_WAIT = 0.05
 
-class URLReaderKeepAlive(BaseURLReader, Process):
-    def __init__(self, url: str, chunk_size: int, buffer_size: Optional[int]=None):
+# Readers are created on threads, alongside part workers, checksum pools and progress renderers. Forking would copy
+# locks held by those threads into the child, where they are never released. Start keep-alive processes from a single
+# threaded fork server where available.
+_keep_alive_context = multiprocessing.get_context("forkserver" if "forkserver" in
+                                                  multiprocessing.get_all_start_methods() else "spawn")
+
+class URLReaderKeepAlive(BaseURLReader, _keep_alive_context.Process):  # type: ignore
+    def __init__(self, url: str, chunk_size: int, buffer_size: Optional[int]=None, size: Optional[int]=None):
         buffer_size = buffer_size or self.compute_buffer_size(1, chunk_size)
         assert buffer_size >= 3 * chunk_size, "'buffer_size' is too small."
         self.url = url
         self.chunk_size = chunk_size
-        self.size = http.size(url)
+        self.size = http.size(url) if size is None else size
         self._start = self._stop = 0
         self.max_read = (buffer_size - chunk_size)
         self._buf = SharedCircularBuffer(size=buffer_size, create=True)
+        self._buf_name = self._buf.name
+        # Signalled whenever 'start' or 'stop' advances. Waits time out as a safeguard against a stalled peer.
+        self._cond = _keep_alive_context.Condition()
         super().__init__()
 
+    def __getstate__(self):
+        # Sent to the child process, which attaches to the circular buffer by name in 'run'
+        state = self.__dict__.copy()
+        state['_buf'] = None
+        return state
+
     @staticmethod
     def compute_buffer_size(concurrent_downloads: int, chunk_size: int) -> int:
-        """Compute the largest buffer size given the number of concurrent downloads."""
+        """Compute the largest buffer size given the number of concurrent downloads. Buffers are capped at a power of
+        two multiple of 'chunk_size', allowing circular buffer coordinates to wrap with a bitmask.
+        """
         shm_sz = available_shared_memory()
         if -1 == shm_sz:
-            buffer_size = 100 * chunk_size
+            buffer_size = 128 * chunk_size
         else:
             buffer_size = shm_sz // concurrent_downloads
             buffer_size = (buffer_size // chunk_size - 1) * chunk_size
-            if buffer_size > 100 * chunk_size:
-                buffer_size = 100 * chunk_size
+            if buffer_size > 128 * chunk_size:
+                buffer_size = 128 * chunk_size
         return buffer_size
 
     def run(self):
         with http_session().get(self.url, stream=True) as resp:
             handle = resp.raw
             start = stop = 0
-            with SharedCircularBuffer(self._buf.name) as buf:
+            with SharedCircularBuffer(self._buf_name) as buf:
                 while True:
                     while stop - start + self.chunk_size >= buf.size:
                         # If there's no more room in the buffer, wait for the reader
-                        time.sleep(READ_WAIT)
+                        with self._cond:
+                            if stop - buf.start + self.chunk_size >= buf.size:
+                                self._cond.wait(READ_WAIT)
                         start = buf.start
                         if -1 == start:
                             return
@@ -192,15 +332,28 @@ class URLReaderKeepAlive(BaseURLReader, Process):
                         break
                     stop += bytes_read
                     buf.stop = stop
+                    self._notify()
+
+    def _notify(self):
+        with self._cond:
+            self._cond.notify_all()
+
+    def _wait_for_data(self, stop: int) -> int:
+        """Wait until data beyond 'stop' is available, and return the new value of 'stop'."""
+        with self._cond:
+            if stop == self._buf.stop:
+                self._cond.wait(READ_WAIT)
+        return self._buf.stop
 
     def read(self, sz: int=-1):
-        if -1 == sz:
+        if -1 == sz or sz > self.max_read:
             sz = self.max_read
         self._buf.start = self._start
-        sz = min(sz, self.max_read)
+        self._notify()
         while sz > self._stop - self._start and self._stop < self.size:
-            self._stop = self._buf.stop
-        sz = min(sz, self._stop - self._start)
+            self._stop = self._wait_for_data(self._stop)
+        if sz > self._stop - self._start:
+            sz = self._stop - self._start
         if sz:
             res = self._buf[self._start: self._start + sz]
             self._start += len(res)
@@ -211,12 +364,15 @@ class URLReaderKeepAlive(BaseURLReader, Process):
     def readinto(self, buff: bytearray) -> int:
         d = self.read(len(buff))
         bytes_read = len(d)
-        buff[:bytes_read] = d
+        _copy_into(buff, d)
         d.release()
         return bytes_read
 
     def close(self):
+        if self._buf is None:
+            return  # the child process' copy, which owns neither the buffer nor the process
         self._buf.start = -1
+        self._notify()
         self.join(timeout=5)
         self._buf.close()
         super().close()
@@ -232,54 +388,62 @@ class URLReaderKeepAlive(BaseURLReader, Process):
     def iter_content(cls,
                      url: str,
                      chunk_size: int,
-                     buffer_size: Optional[int]=None) -> Generator[memoryview, None, None]:
+                     buffer_size: Optional[int]=None,
+                     size: Optional[int]=None) -> Generator[memoryview, None, None]:
         """Fetch parts and yield in order, pre-fetching with concurrency equal to `concurrency`. Parts are 'memoryview'
-        objects that reference multiprocessing shared memory.
+        objects that reference multiprocessing shared memory. Provide 'size' if already known.
         """
-        with cls(url, chunk_size, buffer_size) as reader:
+        with cls(url, chunk_size, buffer_size, size) as reader:
             start = stop = 0
             reader._buf.start = 0
             while True:
                 while stop - start < reader.chunk_size and stop < reader.size:
-                    time.sleep(READ_WAIT)
-                    stop = reader._buf.stop
+                    stop = reader._wait_for_data(stop)
                 read_length = min(chunk_size, stop - start)
                 if not read_length:
                     break
                 res = reader._buf[start: start + read_length]
-                start += read_length
+                start += len(res)  # parts are truncated where the circular buffer wraps
                 try:
                     yield res
                 finally:
                     res.release()
                 reader._buf.start = start
+                reader._notify()
 
 def _number_of_parts(size: int, chunk_size: int) -> int:
-    return ceil(size / chunk_size)
-
-def _part_range(size: int, chunk_size: int, part_id: int) -> Tuple[int, int]:
-    start = part_id * chunk_size
-    if part_id == (_number_of_parts(size, chunk_size) - 1):
-        part_size = size % chunk_size or chunk_size
-    else:
-        part_size = chunk_size
-    return start, part_size
+    return -(-size // chunk_size)
 
-def part_coords(size: int, chunk_size: int):
-    for part_id in range(_number_of_parts(size, chunk_size)):
-        start, part_size = _part_range(size, chunk_size, part_id)
-        yield part_id, start, part_size
+def part_coords(size: int, chunk_size: int) -> Generator[Tuple[int, int, int], None, None]:
+    # Only the last part may be short: compute its size once rather than for every part
+    number_of_parts = _number_of_parts(size, chunk_size)
+    for part_id in range(number_of_parts - 1):
+        yield part_id, part_id * chunk_size, chunk_size
+    if number_of_parts:
+        start = (number_of_parts - 1) * chunk_size
+        yield number_of_parts - 1, start, size - start
 
 def _fetch_part_uo(url: str,
                    part_id: int,
                    start: int,
                    part_size: int,
-                   sb_name: str,
-                   sb_index: int) -> Tuple[int, int, int, int]:
-    # This method is executed in subprocesses. Rerferences to global variables should be avoided.
+                   sb: Union[SharedBufferArray, str],
+                   sb_index: int,
+                   sb_chunk_size: int=0,
+                   sb_num_chunks: int=0) -> Tuple[int, int, int, int]:
+    # This method may be executed in subprocesses. Rerferences to global variables should be avoided.
     # See https://docs.python.org/3/library/multiprocessing.html#programming-guidelines
-    buf = SharedBufferArray(sb_name)
-    http_session().get_range_readinto(url, start, part_size, buf[sb_index][:part_size])
+    # Only subprocesses attach to the shared memory by name.
+    buf = SharedBufferArray(sb, sb_chunk_size, sb_num_chunks) if isinstance(sb, str) else sb
+    try:
+        part = buf[sb_index][:part_size]
+        try:
+            _worker_session(os.getpid()).get_range_readinto(url, start, part_size, part)
+        finally:
+            part.release()
+    finally:
+        if buf is not sb:
+            buf.close()
     return part_id, start, part_size, sb_index
 
 def iter_content_unordered(url: str,
@@ -291,17 +455,16 @@ def iter_content_unordered(url: str,
     """
     assert 1 <= concurrency
     size = http.size(url)
-    parts_to_fetch = deque(part_coords(size, chunk_size))
+    parts_to_fetch = part_coords(size, chunk_size)
     with SharedBufferArray(chunk_size=chunk_size, num_chunks=concurrency, create=True) as buff:
-        with ProcessPoolExecutor(max_workers=concurrency) as e:
-            future_parts = ConcurrentPool(e, concurrency)
-            for i in range(concurrency):
-                future_parts.put(_fetch_part_uo, url, *parts_to_fetch.popleft(), buff.name, i)
+        with ThreadPoolExecutor(max_workers=concurrency) as e, ConcurrentPool(e, concurrency) as future_parts:
+            for i, part_coord in enumerate(islice(parts_to_fetch, concurrency)):
+                future_parts.put(_fetch_part_uo, url, *part_coord, buff, i)
             for part_id, start, part_size, i in future_parts:
                 part = buff[i][:part_size]
                 try:
                     yield part_id, part
                 finally:
                     part.release()
-                if parts_to_fetch:
-                    future_parts.put(_fetch_part_uo, url, *parts_to_fetch.popleft(), buff.name, i)
+                for part_coord in islice(parts_to_fetch, 1):
+                    future_parts.put(_fetch_part_uo, url, *part_coord, buff, i)
@@ -1,5 +1,6 @@
 import os
 import sys
+import mmap
 from uuid import uuid4
 from typing import Optional, Tuple, Union
 
@@ -29,34 +30,122 @@ def resolve_target(url: str, filepath: Optional[str]=None) -> str:
             filepath = os.path.join(dirs, os.path.basename(filepath))
     return filepath
 
+class DirectWriter:
+    """Unbuffered binary file writer that bypasses the page cache, using O_DIRECT on Linux and F_NOCACHE on macOS.
+    O_DIRECT requires aligned writes, so data is staged in a page aligned buffer and written in whole blocks. The final
+    block is padded, then the file is truncated to the number of bytes written. If the file system does not support
+    O_DIRECT, the page cache is used.
+    """
+    alignment = 4096
+    block_size = 8 * 1024 * 1024
+
+    def __init__(self, filepath: str):
+        flags = os.O_WRONLY | os.O_CREAT | os.O_TRUNC
+        try:
+            self._fd = os.open(filepath, flags | getattr(os, "O_DIRECT", 0))
+        except OSError:
+            self._fd = os.open(filepath, flags)
+        if "darwin" == sys.platform:
+            import fcntl
+            fcntl.fcntl(self._fd, fcntl.F_NOCACHE, 1)  # type: ignore
+        self._buf = mmap.mmap(-1, self.block_size)  # anonymous maps are page aligned
+        self._view = memoryview(self._buf)
+        self._fill = 0
+        self._bytes_written = 0
+        self.closed = False
+
+    def fileno(self) -> int:
+        return self._fd
+
+    def write(self, data: Union[bytes, bytearray, memoryview]) -> int:
+        data = memoryview(data)
+        size = len(data)
+        while data:
+            length = min(len(data), self.block_size - self._fill)
+            self._view[self._fill: self._fill + length] = data[:length]
+            self._fill += length
+            data = data[length:]
+            if self.block_size == self._fill:
+                self._flush(self.block_size)
+        self._bytes_written += size
+        return size
+
+    def _flush(self, length: int):
+        written = 0
+        while written < length:
+            written += os.write(self._fd, self._view[written:length])
+        self._fill = 0
+
+    def truncate(self):
+        pass  # the file is truncated to the bytes written during close
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                if self._fill:
+                    padded_length = -(-self._fill // self.alignment) * self.alignment
+                    self._view[self._fill:padded_length] = bytes(padded_length - self._fill)
+                    self._flush(padded_length)
+                os.ftruncate(self._fd, self._bytes_written)
+            finally:
+                os.close(self._fd)
+                self._view.release()
+                self._buf.close()
+
 class indirect_open:
     """This should be used as a context manager. Provides a file object to a temporary file. Temporary file is moved to
     'filepath' if no error occurs before close. Attempt to remove temporary file in all cases.
+
+    If 'size' is provided, space is preallocated for the temporary file when supported by the platform and file system.
+    If 'direct' is True, a 'DirectWriter' is provided, bypassing the page cache.
     """
-    def __init__(self, filepath: str, tmp: Optional[str]=None):
+    def __init__(self, filepath: str, tmp: Optional[str]=None, size: Optional[int]=None, direct: bool=False):
         assert filepath == os.path.normpath(filepath)
         self.filepath = filepath
         self.tmp = tmp or f"{os.path.dirname(filepath)}/.getm-{uuid4()}"
+        self.size = size
+        self.direct = direct
 
     def __enter__(self):
-        self.handle = open(self.tmp, "wb", buffering=0)
+        if self.direct:
+            self.handle = DirectWriter(self.tmp)
+        else:
+            self.handle = open(self.tmp, "w+b", buffering=0)  # readable, so it may be memory mapped
+        if self.size:
+            try:
+                os.posix_fallocate(self.handle.fileno(), 0, self.size)
+            except (AttributeError, OSError):
+                # posix_fallocate is not available on macOS, and is not supported by all file systems
+                pass
         return self.handle
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.handle.close()
-        if exc_type is None:
-            if os.path.isfile(self.filepath):
-                os.remove(self.filepath)
-            os.link(self.tmp, self.filepath)
-        os.remove(self.tmp)
+        replaced = False
+        try:
+            if exc_type is None and self.size:
+                # discard preallocated space that was not written
+                self.handle.truncate()
+            self.handle.close()
+            if exc_type is None:
+                # Atomically replace any existing file at 'filepath'
+                os.replace(self.tmp, self.filepath)
+                replaced = True
+        finally:
+            if not replaced:
+                self.handle.close()  # no-op if already closed
+                try:
+                    os.remove(self.tmp)
+                except OSError:
+                    pass
 
 def available_shared_memory() -> int:
     """Return the amount of available shared memory. If this cannot be determined, return '-1'."""
     if "darwin" == sys.platform:
         return -1
     elif "linux" == sys.platform:
-        import shutil
-        total, used, free = shutil.disk_usage("/dev/shm")
-        return free
+        # Not cached: free space changes as concurrent readers allocate and release buffers
+        st = os.statvfs("/dev/shm")
+        return st.f_bavail * st.f_frsize
     else:
         raise RuntimeError("Your system is not supported.")
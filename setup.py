@@ -60,6 +60,7 @@ setup(
     entry_points=dict(console_scripts=['getm=getm.cli:main']),
     zip_safe=False,
     install_requires=install_requires,
+    extras_require=dict(crc32c=["crc32c"], fastjsonschema=["fastjsonschema"]),
     platforms=['MacOS X', 'Posix'],
     test_suite='test',
     classifiers=[
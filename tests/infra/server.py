@@ -5,11 +5,12 @@ from http.server import HTTPServer, BaseHTTPRequestHandler
 
 
 class ThreadedLocalServer(threading.Thread):
-    def __init__(self, handler_class: BaseHTTPRequestHandler):
+    def __init__(self, handler_class: BaseHTTPRequestHandler, server_class: type=HTTPServer):
         super().__init__(daemon=True)
         self.port = _get_port()
         self.host = f"http://localhost:{self.port}"
         self._handler_class = handler_class
+        self._server_class = server_class
         self._server = None
         self._server_ready = threading.Event()
 
@@ -18,7 +19,7 @@ class ThreadedLocalServer(threading.Thread):
         self._server_ready.wait()
 
     def run(self):
-        self._server = HTTPServer(('', self.port), self._handler_class)
+        self._server = self._server_class(('', self.port), self._handler_class)
         self._server_ready.set()
         self._server.serve_forever()
 
@@ -2,17 +2,22 @@
 import io
 import os
 import sys
+import base64
 import hashlib
 import unittest
 from uuid import uuid4
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
 
 import boto3
+import google_crc32c
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
 from getm.reader import http
-from getm.checksum import MB, MD5, S3MultiEtag, GSCRC32C, _s3_multipart_layouts, part_count_from_s3_etag
+from getm.checksum import (MB, MD5, S3Etag, S3MultiEtag, GSCRC32C, GETMChecksum, _s3_multipart_layouts,
+                           crc32c_combine, part_count_from_s3_etag)
 from tests.infra import GS, S3, suppress_warnings
 
 
@@ -41,6 +46,35 @@ class TestChecksum(unittest.TestCase):
         s3etags.update(memoryview(data))
         self.assertTrue(s3etags.matches(expected))
 
+    def test_s3_multi_etag(self):
+        size, number_of_parts = 10 * MB + 5, 3
+        data = os.urandom(size)
+        for part_size in _s3_multipart_layouts(size, number_of_parts):
+            with self.subTest(part_size=part_size):
+                part_digests = b"".join(hashlib.md5(data[i: i + part_size]).digest()
+                                        for i in range(0, size, part_size))
+                expected = f"{hashlib.md5(part_digests).hexdigest()}-{number_of_parts}"
+                s3etags = S3MultiEtag(size, number_of_parts)
+                for i in range(0, size, 3 * MB // 4):
+                    s3etags.update(memoryview(data)[i: i + 3 * MB // 4])
+                self.assertTrue(s3etags.matches(expected))
+
+    def test_s3_multi_etag_no_layouts(self):
+        size, number_of_parts = 34296661, 8
+        self.assertEqual([], _s3_multipart_layouts(size, number_of_parts))
+        cs = GETMChecksum("3a7f0e40ee0f5b28ab43d3e13dc9a1e9-8", "s3_etag")
+        cs.set_s3_size_and_part_count(size, number_of_parts)
+        cs.update(memoryview(bytes(size)))
+        self.assertFalse(cs.matches())
+
+    def test_getm_checksum_s3_etag(self):
+        tests = [(S3Etag, 4 * MB, 4), (S3Etag, 4 * MB, 1), (S3MultiEtag, 10 * MB + 5, 3)]
+        for expected_class, size, number_of_parts in tests:
+            with self.subTest(size=size, number_of_parts=number_of_parts):
+                cs = GETMChecksum("expected", "s3_etag")
+                cs.set_s3_size_and_part_count(size, number_of_parts)
+                self.assertIsInstance(cs.cs, expected_class)
+
     def test_gs_crc32c(self):
         key = f"test_read/{uuid4()}"
         expected_data = os.urandom(1024)
@@ -52,6 +86,50 @@ class TestChecksum(unittest.TestCase):
         crc32c.update(memoryview(data))
         self.assertTrue(crc32c.matches(expected))
 
+    def test_bytes_like(self):
+        data = os.urandom(2 * MB + 7)
+        expected_crc32c = base64.b64encode(google_crc32c.Checksum(data).digest()).decode("utf-8")
+        part_digests = b"".join(hashlib.md5(data[i: i + MB]).digest() for i in range(0, len(data), MB))
+        expected_etag = hashlib.md5(part_digests).hexdigest() + "-3"
+        for data_type in (bytes, bytearray, memoryview):
+            with self.subTest(data_type=data_type):
+                crc32c = GSCRC32C()
+                crc32c.update(data_type(data))
+                self.assertTrue(crc32c.matches(expected_crc32c))
+                s3etag = S3Etag(MB)
+                s3etag.update(data_type(data))
+                self.assertTrue(s3etag.matches(expected_etag))
+
+    def test_gs_crc32c_google_crc32c_fallback(self):
+        data = os.urandom(2 * MB + 7)
+        expected = base64.b64encode(google_crc32c.Checksum(data).digest()).decode("utf-8")
+        with mock.patch("getm.checksum._hardware_crc32c", return_value=None):
+            for data_type in (bytes, bytearray, memoryview):
+                with self.subTest(data_type=data_type):
+                    crc32c = GSCRC32C()
+                    crc32c.update(data_type(data))
+                    self.assertTrue(crc32c.matches(expected))
+
+    def test_crc32c_combine(self):
+        for len1, len2 in [(0, 0), (0, 7), (5, 0), (1021, 1), (3 * MB + 7, 12345)]:
+            with self.subTest(len1=len1, len2=len2):
+                data1, data2 = os.urandom(len1), os.urandom(len2)
+                crc = crc32c_combine(google_crc32c.value(data1), google_crc32c.value(data2), len2)
+                self.assertEqual(google_crc32c.value(data1 + data2), crc)
+
+    def test_gs_crc32c_parallel(self):
+        data = os.urandom(3 * MB + 7)
+        expected = base64.b64encode(google_crc32c.Checksum(data).digest()).decode("utf-8")
+        with ThreadPoolExecutor(max_workers=2) as e:
+            with mock.patch("getm.checksum._crc32c_executor", return_value=e):
+                with mock.patch("getm.checksum.CRC32C_PARALLEL_SIZE", MB):
+                    with mock.patch("getm.checksum.CRC32C_SLICE_SIZE", MB // 3):
+                        crc32c = GSCRC32C()
+                        crc32c.update(b"")
+                        crc32c.update(memoryview(data)[:MB - 1])
+                        crc32c.update(memoryview(data)[MB - 1:])
+                        self.assertTrue(crc32c.matches(expected))
+
     def test_s3_multipart_layouts(self):
         size = 54743580
         num_parts = 4
@@ -7,6 +7,7 @@ from uuid import uuid4
 from hashlib import md5
 from unittest import mock
 from tempfile import TemporaryDirectory
+from concurrent.futures import ProcessPoolExecutor
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
@@ -14,7 +15,7 @@ sys.path.insert(0, pkg_root)  # noqa
 from jsonschema.exceptions import ValidationError
 
 from getm import cli
-from getm.checksum import GETMChecksum, MD5
+from getm.checksum import ChecksumMismatch, GETMChecksum, MD5
 
 from tests.infra import suppress_warnings, suppress_output
 from tests.infra.server import ThreadedLocalServer, SilentHandler
@@ -41,8 +42,16 @@ def setUpModule():
             self.end_headers()
 
         def do_GET(self, *args, **kwargs):
-            self.do_HEAD(*args, **kwargs)
-            self.wfile.write(Server.data[self.path])
+            if "Range" in self.headers:
+                data = Server.data[self.path]
+                start, stop = (int(c) for c in self.headers['Range'].split("=", 1)[1].split("-"))
+                self.send_response(206)
+                self.send_header("Content-Length", len(data[start: stop + 1]))
+                self.end_headers()
+                self.wfile.write(data[start: stop + 1])
+            else:
+                self.do_HEAD(*args, **kwargs)
+                self.wfile.write(Server.data[self.path])
 
     Server.server = ThreadedLocalServer(Handler)
     Server.server.start()
@@ -102,11 +111,10 @@ class TestCLI(unittest.TestCase):
         with self.subTest("routing"):
             with mock.patch("getm.cli.oneshot") as mock_oneshot:
                 with mock.patch("getm.cli.multipart") as mock_multipart:
-                    with mock.patch("getm.cli.resolve_target"):
-                        for info in manifest:
-                            cli._download(info['url'], info['filepath'], None, 1, multipart_threshold)
-                        self.assertEqual(len(oneshot_sizes), len(mock_oneshot.call_args_list))
-                        self.assertEqual(len(multipart_sizes), len(mock_multipart.call_args_list))
+                    for info in manifest:
+                        cli._download(info['url'], info['filepath'], None, 1, multipart_threshold)
+                    self.assertEqual(len(oneshot_sizes), len(mock_oneshot.call_args_list))
+                    self.assertEqual(len(multipart_sizes), len(mock_multipart.call_args_list))
 
         with self.subTest("assertions", concurrency=0):
             with self.assertRaises(AssertionError):
@@ -120,6 +128,27 @@ class TestCLI(unittest.TestCase):
                 with open(info['filepath'], "rb") as fh:
                     self.assertEqual(Server.data[path], fh.read())
 
+        with self.subTest("keep-alive readers started from download threads"):
+            # Multipart downloads share the process with download and part worker threads, so keep-alive readers
+            # must not be forked
+            start_methods = list()
+            start = cli.URLReaderKeepAlive.start
+
+            def recording_start(reader):
+                start(reader)
+                start_methods.append(reader._popen.method)
+
+            for info in manifest:
+                os.remove(info['filepath'])
+            with mock.patch.object(cli.URLReaderKeepAlive, "start", recording_start):
+                cli.download(manifest, concurrency=2, multipart_threshold=multipart_threshold)
+            self.assertEqual(len(multipart_sizes), len(start_methods))
+            self.assertNotIn("fork", start_methods)
+            for info in manifest:
+                path = "/" + info['url'].rsplit("/", 1)[-1]
+                with open(info['filepath'], "rb") as fh:
+                    self.assertEqual(Server.data[path], fh.read())
+
     def test_oneshot(self, *args):
         url, expected_data = Server.set_data(1021)
 
@@ -136,9 +165,14 @@ class TestCLI(unittest.TestCase):
 
         with self.subTest("Incorrect caller provided checksum"):
             cs = GETMChecksum("so wrong!", "md5")
-            with self.assertRaises(AssertionError):
+            with self.assertRaises(ChecksumMismatch):
                 cli.oneshot(url, self.filepath, cs)
 
+        for size in (len(expected_data) - 5, len(expected_data) + 5):
+            with self.subTest("size mismatch without checksum", size=size):
+                with self.assertRaises(ValueError):
+                    cli.oneshot(url, self.filepath, GETMChecksum("", "null"), size)
+
     @mock.patch("getm.cli.default_chunk_size_keep_alive", 1021)
     def test_multipart(self, *args):
         url, expected_data = Server.set_data(999983)
@@ -158,9 +192,25 @@ class TestCLI(unittest.TestCase):
 
         with self.subTest("Incorrect caller provided checksum"):
             cs = GETMChecksum("so wrong!", "md5")
-            with self.assertRaises(AssertionError):
+            with self.assertRaises(ChecksumMismatch):
                 cli.multipart(url, self.filepath, buffer_size, cs)
 
+        with self.subTest("concurrent range requests"):
+            cs = GETMChecksum(md5(expected_data).hexdigest(), "md5")
+            with mock.patch("getm.cli.default_chunk_size_concurrent", 1021 * 7):
+                cli.multipart(url, self.filepath, buffer_size, cs, part_concurrency=3)
+            with open(self.filepath, "rb") as fh:
+                self.assertEqual(expected_data, fh.read())
+
+        with self.subTest("concurrent range requests with shared process pool"):
+            with ProcessPoolExecutor(max_workers=3) as e:
+                for _ in range(2):
+                    cs = GETMChecksum(md5(expected_data).hexdigest(), "md5")
+                    with mock.patch("getm.cli.default_chunk_size_concurrent", 1021 * 7):
+                        cli.multipart(url, self.filepath, buffer_size, cs, part_concurrency=3, part_executor=e)
+                    with open(self.filepath, "rb") as fh:
+                        self.assertEqual(expected_data, fh.read())
+
     def test_validate_manifest(self, *args):
         good_manifests = [
             [{"url": "sdf"}],
@@ -174,14 +224,16 @@ class TestCLI(unittest.TestCase):
             [{"url": "sdf", "checksum": "foo"}],  # 'checksum', 'checksum-algorthm' not paired
         ]
 
-        for manifest in good_manifests:
-            with self.subTest("good"):
-                cli._validate_manifest(manifest)
+        for fastjsonschema in (cli.fastjsonschema, None):
+            with mock.patch("getm.cli.fastjsonschema", fastjsonschema):
+                for manifest in good_manifests:
+                    with self.subTest("good", fastjsonschema=fastjsonschema):
+                        cli._validate_manifest(manifest)
 
-        for manifest in bad_manifests:
-            with self.subTest("bad"):
-                with self.assertRaises(ValidationError):
-                    cli._validate_manifest(manifest)
+                for manifest in bad_manifests:
+                    with self.subTest("bad", fastjsonschema=fastjsonschema):
+                        with self.assertRaises(ValidationError):
+                            cli._validate_manifest(manifest)
 
 if __name__ == '__main__':
     unittest.main()
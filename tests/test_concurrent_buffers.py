@@ -2,19 +2,65 @@
 import os
 import sys
 import unittest
+from array import array
 from random import randint
 from concurrent.futures import ProcessPoolExecutor, as_completed
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
-from getm.concurrent import SharedBufferArray
+from getm.concurrent import SharedCircularBuffer, SharedBufferArray
+from getm.concurrent.buffers import PAGE_SZ
 
 
 def _write(sb_name, chunk_id, chunk_content):
     with SharedBufferArray(sb_name) as sb:
         sb[chunk_id][:] = chunk_content
 
+def _write_circular(sb_name, start, stop, content):
+    with SharedCircularBuffer(sb_name) as sb:
+        sb[start:stop] = content
+        sb.start, sb.stop = start, stop
+
+class TestSharedCircularBuffer(unittest.TestCase):
+    def test_layout(self):
+        for size in (1, PAGE_SZ, PAGE_SZ + 1):
+            with self.subTest(size=size):
+                with SharedCircularBuffer(size=size, create=True) as sb:
+                    self.assertEqual(size, sb.size)
+                    self.assertEqual(0, sb._shared_memory.size % PAGE_SZ)
+                    with SharedCircularBuffer(sb.name) as attached:
+                        self.assertEqual(size, attached.size)
+
+    def test_wrap(self):
+        for size in (PAGE_SZ, 3 * PAGE_SZ, 3 * PAGE_SZ + 5):
+            with SharedCircularBuffer(size=size, create=True) as sb:
+                for start in (0, PAGE_SZ - 5, 3 * PAGE_SZ + 7):
+                    with self.subTest(size=size, start=start):
+                        expected = os.urandom(randint(1, PAGE_SZ))
+                        stop = start + len(expected)
+                        with ProcessPoolExecutor(max_workers=1) as e:
+                            e.submit(_write_circular, sb.name, start, stop, expected).result()
+                        self.assertEqual((start, stop), (sb.start, sb.stop))
+                        data = b""
+                        while len(data) < len(expected):
+                            part = sb[start + len(data):stop]
+                            data += bytes(part)
+                            part.release()
+                        self.assertEqual(expected, data)
+
+    def test_setitem_typed_buffer(self):
+        expected = array("L", range(PAGE_SZ // 16))
+        start, stop = PAGE_SZ - 5, PAGE_SZ - 5 + len(expected) * expected.itemsize
+        with SharedCircularBuffer(size=PAGE_SZ, create=True) as sb:
+            sb[start:stop] = expected
+            data = b""
+            while start + len(data) < stop:
+                part = sb[start + len(data):stop]
+                data += bytes(part)
+                part.release()
+            self.assertEqual(expected.tobytes(), data)
+
 class TestSharedBufferArray(unittest.TestCase):
     def test_foo(self):
         num_chunks, chunk_size = 4, 5
@@ -29,6 +75,12 @@ class TestSharedBufferArray(unittest.TestCase):
                 for f in as_completed(futures):
                     f.result()
             self.assertEqual(expected, bytes(sb._shared_memory.buf[:num_chunks * chunk_size]))
+            self.assertEqual(expected[chunk_size:2 * chunk_size], bytes(sb[1]))
+            with sb[1]:
+                pass  # releasing one view must not invalidate the chunk
+            self.assertEqual(expected[chunk_size:2 * chunk_size], bytes(sb[1]))
+            with self.assertRaises(IndexError):
+                sb[num_chunks]
 
 if __name__ == '__main__':
     unittest.main()
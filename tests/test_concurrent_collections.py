@@ -32,6 +32,12 @@ class ConcurrentCollectionTests:
         fs.abort()
         self.assertLessEqual(start_time - time.time(), numbers[-1])
 
+    def test_context_manager(self):
+        with self.ac_class(self.executor, concurrency=1) as fs:
+            for cs in range(3):
+                fs.put(_wait_and_return, cs)
+        self.assertFalse(fs.running())
+
     def test_exceptions(self):
         def func_that_raises(*args, **kwargs):
             raise RuntimeError("doom")
@@ -84,6 +90,13 @@ class TestConcurrentPool(ConcurrentCollectionTests, unittest.TestCase):
             with self.assertRaises(AssertionError):
                 fs = ConcurrentPool(self.executor, concurrency=-1)
 
+    def test_put_then_get_same_thread(self):
+        numbers = list(range(7))
+        fs = ConcurrentPool(self.executor, concurrency=2)
+        for n in numbers:
+            fs.put(_wait_and_return, n, 0.01)  # results are not consumed until every operation is put
+        self.assertEqual(numbers, sorted(fs))
+
 class TestConcurrentQueue(ConcurrentCollectionTests, unittest.TestCase):
     ac_class = ConcurrentQueue
 
@@ -138,6 +151,15 @@ class TestConcurrentHeap(ConcurrentCollectionTests, unittest.TestCase):
             returned_numbers = [n for n in fs]
             self.assertEqual(sorted(returned_numbers), sorted(numbers))
 
+    def test_priority_order(self):
+        fs = ConcurrentHeap(self.executor, concurrency=1)
+        fs.put(_wait_and_return, "first", 0.1)  # occupies the only slot
+        fs.priority_put(-1, _wait_and_return, "low")
+        fs.put(_wait_and_return, "default-a")
+        fs.priority_put(5, _wait_and_return, "high")
+        fs.priority_put(1, _wait_and_return, "default-b")
+        self.assertEqual(["first", "high", "default-a", "default-b", "low"], [n for n in fs])
+
     def test_limited_execution(self):
         numbers = [2,3,5]
         with self.subTest("limit execution to concurrency"):
@@ -21,7 +21,7 @@ class TestGetm(unittest.TestCase):
     def test_dispatch(self):
         with contextlib.ExitStack() as stack:
             stack.enter_context(mock.patch("getm.reader.SharedCircularBuffer"))
-            stack.enter_context(mock.patch("getm.reader.ProcessPoolExecutor"))
+            stack.enter_context(mock.patch("getm.reader.ThreadPoolExecutor"))
             stack.enter_context(mock.patch("getm.reader.ConcurrentQueue"))
             stack.enter_context(mock.patch("getm.reader.ConcurrentPool"))
             stack.enter_context(mock.patch("getm.reader.http"))
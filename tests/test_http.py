@@ -2,11 +2,16 @@
 import io
 import os
 import sys
+import time
 import requests
 import unittest
 import warnings
+import threading
 from uuid import uuid4
+from unittest import mock
 from random import randint
+from http.server import ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
@@ -38,6 +43,33 @@ class HeadHandler(SilentHandler):
     def do_GET(self, *args, **kwargs):
         self.do_HEAD(*args, **kwargs)
 
+class RangeHandler(SilentHandler):
+    """Serve range requests for 'data' over keep-alive connections, counting the connections opened."""
+    protocol_version = "HTTP/1.1"
+    data = b""
+    connections = 0
+    delay = 0.0
+    truncate = 0  # number of responses to drop partway through
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with self.lock:
+            RangeHandler.connections += 1
+
+    def do_GET(self, *args, **kwargs):
+        start, stop = [int(v) for v in self.headers['Range'].split("=")[1].split("-")]
+        time.sleep(self.delay)
+        self.send_response(206)
+        self.send_header("Content-Length", str(stop - start + 1))
+        self.end_headers()
+        if RangeHandler.truncate:
+            RangeHandler.truncate -= 1
+            self.wfile.write(self.data[start: start + (stop - start) // 2])
+            self.close_connection = True
+        else:
+            self.wfile.write(self.data[start: stop + 1])
+
 class TestHTTP(unittest.TestCase):
     def setUp(self):
         suppress_warnings()
@@ -105,6 +137,82 @@ class TestHTTP(unittest.TestCase):
 
             self.assertEqual(expected_recount, retry_count['count'])
 
+    def test_get_range_readinto(self):
+        data = os.urandom(1021)
+
+        class Handler(SilentHandler):
+            protocol_version = "HTTP/1.1"
+            truncate = 2
+
+            def do_GET(self, *args, **kwargs):
+                start, stop = [int(v) for v in self.headers['Range'].split("=")[1].split("-")]
+                self.send_response(206)
+                self.send_header("Content-Length", str(stop - start + 1))
+                self.end_headers()
+                if Handler.truncate:
+                    # Drop the connection partway through the part
+                    Handler.truncate -= 1
+                    self.wfile.write(data[start: start + (stop - start) // 2])
+                    self.close_connection = True
+                else:
+                    self.wfile.write(data[start: stop + 1])
+
+        with ThreadedLocalServer(Handler) as host:
+            with http_session() as http:
+                buf = bytearray(500)
+                with warnings.catch_warnings():
+                    warnings.simplefilter("ignore")
+                    http.get_range_readinto(host, 17, len(buf), memoryview(buf))
+                self.assertEqual(data[17: 17 + len(buf)], buf)
+
+    def test_get_range_readinto_connection_reuse(self):
+        number_of_reads, part_size = 5, 1021
+        RangeHandler.data = os.urandom(number_of_reads * part_size)
+        RangeHandler.connections, RangeHandler.delay, RangeHandler.truncate = 0, 0.0, 1
+        with ThreadedLocalServer(RangeHandler) as host:
+            with http_session() as http:
+                for start in range(0, len(RangeHandler.data), part_size):
+                    buf = bytearray(part_size)
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("ignore")
+                        http.get_range_readinto(host, start, part_size, memoryview(buf))
+                    self.assertEqual(RangeHandler.data[start: start + part_size], buf)
+        # The first connection is dropped partway through a part. The resumed request, and every read after it,
+        # use one pooled connection.
+        self.assertEqual(2, RangeHandler.connections)
+
+    def test_pool_concurrency(self):
+        number_of_threads, reads_per_thread, part_size = 16, 4, 1021
+        RangeHandler.data = os.urandom(number_of_threads * reads_per_thread * part_size)
+        RangeHandler.connections, RangeHandler.truncate = 0, 0
+        RangeHandler.delay = 0.05  # keep every thread's connection checked out at once
+        barrier = threading.Barrier(number_of_threads)
+
+        def read_parts(http, host, thread_id):
+            for i in range(reads_per_thread):
+                barrier.wait()  # every connection is idle in the pool between rounds
+                start = (thread_id * reads_per_thread + i) * part_size
+                buf = bytearray(part_size)
+                http.get_range_readinto(host, start, part_size, memoryview(buf))
+                self.assertEqual(RangeHandler.data[start: start + part_size], buf)
+
+        with ThreadedLocalServer(RangeHandler, ThreadingHTTPServer) as host:
+            with http_session() as http:
+                with ThreadPoolExecutor(max_workers=number_of_threads) as e:
+                    for f in [e.submit(read_parts, http, host, i) for i in range(number_of_threads)]:
+                        f.result()
+        # Connections are returned to the pool and reused, rather than opened for each read
+        self.assertLessEqual(RangeHandler.connections, number_of_threads)
+
+    def test_head_cache(self):
+        with http_session() as http:
+            http.head_cache_size = 2
+            with mock.patch.object(http, "_head", side_effect=lambda url: dict(url=url)) as head:
+                for url in ("a", "b", "a", "c", "a"):
+                    self.assertEqual(dict(url=url), http.head(url))
+                # "a" is the most recently used url when "c" is added, so "b" is evicted
+                self.assertEqual(["a", "b", "c"], [c.args[0] for c in head.call_args_list])
+
     def test_size(self):
         expected_size = len(self.expected_data)
         for platform, url in [("aws", self.s3_url), ("gcp", self.gs_url)]:
@@ -4,13 +4,14 @@ import sys
 import time
 import unittest
 from random import randint
+from unittest import mock
 
 import boto3
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
-from getm.progress import Chunker
+from getm.progress import Chunker, ProgressBar
 
 
 class TestProgress(unittest.TestCase):
@@ -40,5 +41,13 @@ class TestProgress(unittest.TestCase):
         with self.assertRaises(ValueError):
             c.add(1)
 
+    def test_progress_bar_render_error(self):
+        size = 31
+        with mock.patch.object(ProgressBar, "_draw", side_effect=RuntimeError("draw failed")):
+            with self.assertRaises(RuntimeError):
+                with ProgressBar("test", size) as pb:
+                    for _ in range(size):
+                        pb.add(1)
+
 if __name__ == '__main__':
     unittest.main()
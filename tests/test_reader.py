@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 import io
+import gzip
 import os
 import sys
 import time
@@ -11,12 +12,14 @@ from uuid import uuid4
 from unittest import mock
 from random import randint
 from typing import Optional
+from http.server import ThreadingHTTPServer
 
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
 import getm
 from tests.infra import GS, S3, suppress_warnings
+from tests.infra.server import ThreadedLocalServer, SilentHandler
 
 
 def setUpModule():
@@ -53,7 +56,7 @@ class _CommonReaderTests:
             stack.enter_context(mock.patch("getm.reader.http"))
             stack.enter_context(mock.patch("getm.reader.http_session"))
             stack.enter_context(mock.patch("getm.reader.SharedCircularBuffer", size=3))
-            stack.enter_context(mock.patch("getm.reader.ProcessPoolExecutor"))
+            stack.enter_context(mock.patch("getm.reader.ThreadPoolExecutor"))
             stack.enter_context(mock.patch("getm.reader.ConcurrentQueue"))
             stack.enter_context(mock.patch("getm.reader.available_shared_memory", return_value=1024 ** 3))
             for concurrency in [None, 4]:
@@ -129,16 +132,77 @@ class TestRawReader(_CommonReaderTests, unittest.TestCase):
     def get_iter_content(cls, url: str, chunk_size: Optional[int]=None, concurrency: Optional[int]=None):
         return getm.reader.URLRawReader.iter_content(url, chunk_size)
 
+    def test_read_independent(self):
+        data = os.urandom(1021)
+
+        class Handler(SilentHandler):
+            def do_GET(self, *args, **kwargs):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        with ThreadedLocalServer(Handler) as host:
+            with getm.reader.URLRawReader(host, len(data)) as reader:
+                first, second = reader.read(10), reader.read(10)
+                self.assertEqual(data[:10], bytes(first))
+                self.assertEqual(data[10:20], bytes(second))
+                first.release()
+                second.release()
+
+    def test_read_bounded(self):
+        data = os.urandom(1021)
+
+        class Handler(SilentHandler):
+            def do_GET(self, *args, **kwargs):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        with ThreadedLocalServer(Handler) as host:
+            with mock.patch("getm.reader.RAW_READ_SIZE", 100):
+                with getm.reader.URLRawReader(host, len(data)) as reader:
+                    with mock.patch.object(reader.handle, "readinto", wraps=reader.handle.readinto) as readinto:
+                        first, rest = reader.read(10), reader.read(10 * len(data))
+                        self.assertEqual(data, bytes(first) + bytes(rest))
+                        # The buffer is not allocated beyond the end of the object
+                        self.assertEqual(len(data) - 10, len(rest.obj))
+                        for call in readinto.call_args_list:
+                            self.assertGreaterEqual(100, len(call[0][0]))
+                        first.release()
+                        rest.release()
+
+    def test_iter_content_local(self):
+        data = os.urandom(1021) * 3
+        for content_encoding in (None, "gzip"):
+            with self.subTest(content_encoding=content_encoding):
+                body = gzip.compress(data) if content_encoding else data
+
+                class Handler(SilentHandler):
+                    # HEAD is not implemented: the size must be taken from the GET response
+                    def do_GET(self, *args, **kwargs):
+                        self.send_response(200)
+                        self.send_header("Content-Length", str(len(body)))
+                        if content_encoding:
+                            self.send_header("Content-Encoding", content_encoding)
+                        self.end_headers()
+                        self.wfile.write(body)
+
+                with ThreadedLocalServer(Handler) as host:
+                    parts = [bytes(part) for part in getm.reader.URLRawReader.iter_content(host, 1000)]
+                self.assertEqual(data, b"".join(parts))
+
 class TestURLReader(_CommonReaderTests, unittest.TestCase):
     @classmethod
     def get_reader(cls, url: str, chunk_size: Optional[int]=None, concurrency: Optional[int]=None):
-        chunk_size = chunk_size or getm.default_chunk_size
+        chunk_size = chunk_size or getm.default_chunk_size_concurrent
         concurrency = concurrency or getm.default_concurrency
         return getm.reader.URLReader(url, chunk_size, concurrency)
 
     @classmethod
     def get_iter_content(cls, url: str, chunk_size: Optional[int]=None, concurrency: Optional[int]=None):
-        chunk_size = chunk_size or getm.default_chunk_size
+        chunk_size = chunk_size or getm.default_chunk_size_concurrent
         concurrency = concurrency or getm.default_concurrency
         return getm.reader.URLReader.iter_content(url, chunk_size, concurrency)
 
@@ -162,6 +226,72 @@ class TestURLReader(_CommonReaderTests, unittest.TestCase):
             finally:
                 view.release()
 
+    def test_part_connection_reuse(self):
+        number_of_parts, chunk_size = 5, 1021
+        data = os.urandom(number_of_parts * chunk_size)
+        connections = []
+
+        class Handler(SilentHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                connections.append(self)
+
+            def do_GET(self, *args, **kwargs):
+                start, stop = [int(v) for v in self.headers['Range'].split("=")[1].split("-")]
+                self.send_response(206)
+                self.send_header("Content-Length", str(stop - start + 1))
+                self.end_headers()
+                self.wfile.write(data[start: stop + 1])
+
+        # The worker's pooled connection outlives the test: handle it on a daemon thread so the server can shut down
+        with ThreadedLocalServer(Handler, ThreadingHTTPServer) as host:
+            parts = getm.reader.URLReader.iter_content(host, chunk_size, concurrency=1, size=len(data))
+            self.assertEqual(data, b"".join(bytes(part) for part in parts))
+        # Parts are fetched over the worker's pooled connection, rather than a new connection for each part
+        self.assertEqual(1, len(connections))
+
+    def test_part_buffer_shared_with_threads(self):
+        number_of_parts, chunk_size = 5, 1021
+        data = os.urandom(number_of_parts * chunk_size)
+
+        class Handler(SilentHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self, *args, **kwargs):
+                start, stop = [int(v) for v in self.headers['Range'].split("=")[1].split("-")]
+                self.send_response(206)
+                self.send_header("Content-Length", str(stop - start + 1))
+                self.end_headers()
+                self.wfile.write(data[start: stop + 1])
+
+        with ThreadedLocalServer(Handler, ThreadingHTTPServer) as host:
+            with mock.patch("getm.reader.SharedCircularBuffer", wraps=getm.reader.SharedCircularBuffer) as sb:
+                parts = getm.reader.URLReader.iter_content(host, chunk_size, concurrency=2, size=len(data))
+                self.assertEqual(data, b"".join(bytes(part) for part in parts))
+        # Thread workers write through the reader's buffer, rather than attaching to shared memory for every part
+        self.assertEqual(1, sb.call_count)
+
+    def test_iter_content_single_part(self):
+        data = os.urandom(1021)
+        requests = []
+
+        class Handler(SilentHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self, *args, **kwargs):
+                requests.append(self.headers['Range'])
+                self.send_response(206)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        with ThreadedLocalServer(Handler, ThreadingHTTPServer) as host:
+            parts = [bytes(part) for part in getm.reader.URLReader.iter_content(host, 2048, 2, size=len(data))]
+        self.assertEqual([data], parts)
+        self.assertEqual([f"bytes=0-{len(data) - 1}"], requests)
+
     def test_compute_chunk_and_buf_size(self):
         concurrency = 2
         threshold_chunk_size = 2048
@@ -184,6 +314,33 @@ class TestReaderKeepAlive(_CommonReaderTests, unittest.TestCase):
     def get_iter_content(cls, url: str, chunk_size: Optional[int]=None, concurrency: Optional[int]=None):
         return getm.reader.URLReaderKeepAlive.iter_content(url, chunk_size)
 
+    def test_interface(self):
+        # Mocks cannot be sent to the child process: exercise the interface without starting it
+        with mock.patch.object(getm.reader.URLReaderKeepAlive, "start"), \
+                mock.patch.object(getm.reader.URLReaderKeepAlive, "join"):
+            super().test_interface()
+
+    def test_start_method(self):
+        data = os.urandom(1021 * 7)
+
+        class Handler(SilentHandler):
+            def do_GET(self, *args, **kwargs):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        with ThreadedLocalServer(Handler) as host:
+            with getm.reader.URLReaderKeepAlive(host, 1021, 8 * 1021, len(data)) as reader:
+                # Forking a process with running threads may copy held locks into the child
+                self.assertNotEqual("fork", reader._popen.method)
+                received = b""
+                for _ in range(8):
+                    part = reader.read(1000)
+                    received += bytes(part)
+                    part.release()
+                self.assertEqual(data, received)
+
 class TestIterContentUnordered(unittest.TestCase):
     def setUp(self):
         suppress_warnings()
@@ -212,5 +369,34 @@ class TestIterContentUnordered(unittest.TestCase):
                     chunk.release()
                 self.assertEqual(self.expected_data, data)
 
+    def test_part_buffer_shared_with_threads(self):
+        number_of_parts, chunk_size = 5, 1021
+        data = os.urandom(number_of_parts * chunk_size)
+
+        class Handler(SilentHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_HEAD(self, *args, **kwargs):
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+
+            def do_GET(self, *args, **kwargs):
+                start, stop = [int(v) for v in self.headers['Range'].split("=")[1].split("-")]
+                self.send_response(206)
+                self.send_header("Content-Length", str(stop - start + 1))
+                self.end_headers()
+                self.wfile.write(data[start: stop + 1])
+
+        with ThreadedLocalServer(Handler, ThreadingHTTPServer) as host:
+            with mock.patch("getm.reader.SharedBufferArray", wraps=getm.reader.SharedBufferArray) as sba:
+                received = bytearray(len(data))
+                for part_id, part in getm.reader.iter_content_unordered(host, chunk_size, concurrency=2):
+                    received[part_id * chunk_size: part_id * chunk_size + len(part)] = part
+                    part.release()
+                self.assertEqual(data, received)
+        # Thread workers write through the reader's buffer, rather than attaching to shared memory for every part
+        self.assertEqual(1, sba.call_count)
+
 if __name__ == '__main__':
     unittest.main()
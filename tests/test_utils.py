@@ -9,7 +9,7 @@ from tempfile import TemporaryDirectory
 pkg_root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))  # noqa
 sys.path.insert(0, pkg_root)  # noqa
 
-from getm.utils import resolve_target, available_shared_memory
+from getm.utils import resolve_target, indirect_open, available_shared_memory
 
 
 class TestUtils(unittest.TestCase):
@@ -33,6 +33,41 @@ class TestUtils(unittest.TestCase):
                         self.assertEqual(expected, target)
                         self.assertTrue(os.path.isdir(os.path.dirname(target)))
 
+    def test_indirect_open(self):
+        data = os.urandom(1021)
+        with TemporaryDirectory() as tmpdir:
+            for size in (None, len(data), 2 * len(data)):
+                with self.subTest(size=size):
+                    filepath = f"{tmpdir}/{uuid4()}"
+                    with indirect_open(filepath, size=size) as handle:
+                        handle.write(data)
+                    with open(filepath, "rb") as fh:
+                        self.assertEqual(data, fh.read())
+            with self.subTest("error"):
+                filepath = f"{tmpdir}/{uuid4()}"
+                with self.assertRaises(RuntimeError):
+                    with indirect_open(filepath, size=len(data)) as handle:
+                        raise RuntimeError()
+                self.assertFalse(os.path.exists(filepath))
+            with self.subTest("error moving temporary file"):
+                filepath = f"{tmpdir}/{uuid4()}"
+                with mock.patch("getm.utils.os.replace", side_effect=PermissionError()):
+                    with self.assertRaises(PermissionError):
+                        with indirect_open(filepath, size=len(data)) as handle:
+                            handle.write(data)
+                self.assertFalse(os.path.exists(filepath))
+            with mock.patch("getm.utils.DirectWriter.block_size", 8192):
+                for size in (0, 1021, 4096, 8192, 8192 * 3 + 5):
+                    with self.subTest("direct", size=size):
+                        data = os.urandom(size)
+                        filepath = f"{tmpdir}/{uuid4()}"
+                        with indirect_open(filepath, size=size, direct=True) as handle:
+                            for i in range(0, size, 1000):
+                                handle.write(memoryview(data)[i: i + 1000])
+                        with open(filepath, "rb") as fh:
+                            self.assertEqual(data, fh.read())
+            self.assertEqual([], [name for name in os.listdir(tmpdir) if name.startswith(".getm-")])
+
     def test_available_shared_memory(self):
         shm_sz = available_shared_memory()
         if "darwin" == sys.platform: